@@ -6,24 +6,31 @@
 # (optional: install if not available locally)
 # pip install imbalanced-learn joblib matplotlib seaborn packaging
 
+import argparse
+import os
+import sys
 import pandas as pd
 import joblib
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 from sklearn.model_selection import train_test_split
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
 from imblearn.pipeline import Pipeline as ImbPipeline
 from imblearn.over_sampling import SMOTE
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import roc_auc_score, classification_report, RocCurveDisplay, confusion_matrix
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.metrics import classification_report
 
-# version check for OneHotEncoder
-from sklearn import __version__ as sklearn_version
-from packaging import version
+# shared one-sort evaluation and preprocessing (src/evaluation.py, src/preprocess.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from evaluation import Evaluation
+from preprocess import SPARSE_MIN_LEVELS, build_preprocessor, categorical_mask, onehot_levels, use_sparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--engine", choices=["rf", "hgb"], default="rf",
+                    help="rf: one-hot + SMOTE + RandomForest; hgb: ordinal codes + class-weighted HistGradientBoosting")
+parser.add_argument("--sparse", choices=["auto", "on", "off"], default="auto",
+                    help=f"CSR one-hot matrix through SMOTE and the forest (rf); auto: from {SPARSE_MIN_LEVELS} one-hot columns")
+args = parser.parse_args()
 
 # 1) Load dataset (adjust path if needed)
 df = pd.read_csv(r"D:\AI Hackathon\BankChurners.csv")
@@ -54,49 +61,52 @@ categorical_feats = X.select_dtypes(include=["object", "category"]).columns.toli
 if "Attrition_Flag" in categorical_feats:
     categorical_feats.remove("Attrition_Flag")
 
-# 5) Transformers
-numeric_transformer = Pipeline([
-    ("imputer", SimpleImputer(strategy="median")),
-    ("scaler", StandardScaler())
-])
-
-# choose correct OneHotEncoder param depending on sklearn version
-if version.parse(sklearn_version) >= version.parse("1.2"):
-    onehot = OneHotEncoder(handle_unknown="ignore", sparse_output=False)
+# 5) Transformers (the same ColumnTransformer as src/train.py)
+if args.engine == "hgb":
+    # trees split on raw values: no scaling, categoricals as integer codes (unseen -> -1 = missing)
+    preprocessor = build_preprocessor(numeric_feats, categorical_feats, encoding="ordinal")
 else:
-    onehot = OneHotEncoder(handle_unknown="ignore", sparse=False)
-
-categorical_transformer = Pipeline([
-    ("imputer", SimpleImputer(strategy="most_frequent")),
-    ("onehot", onehot)
-])
-
-preprocessor = ColumnTransformer([
-    ("num", numeric_transformer, numeric_feats),
-    ("cat", categorical_transformer, categorical_feats)
-])
+    # high-cardinality codes (branch, product, region): keep the one-hot matrix sparse (CSR)
+    sparse = use_sparse(X_train, categorical_feats, args.sparse)
+    print(f"One-hot columns: {onehot_levels(X_train, categorical_feats)} ({'sparse' if sparse else 'dense'})")
+    preprocessor = build_preprocessor(numeric_feats, categorical_feats, encoding="onehot", sparse=sparse)
 
 # 6) Model pipeline
-model = RandomForestClassifier(
-    n_estimators=200,
-    random_state=42,
-    class_weight="balanced"
-)
-
-pipeline = ImbPipeline(steps=[
-    ("preproc", preprocessor),
-    ("smote", SMOTE(random_state=42)),
-    ("clf", model)
-])
+if args.engine == "hgb":
+    # native categorical support + class weighting instead of SMOTE
+    model = HistGradientBoostingClassifier(
+        categorical_features=categorical_mask(numeric_feats, categorical_feats),
+        class_weight="balanced",
+        random_state=42
+    )
+
+    pipeline = ImbPipeline(steps=[
+        ("preproc", preprocessor),
+        ("clf", model)
+    ])
+else:
+    model = RandomForestClassifier(
+        n_estimators=200,
+        random_state=42,
+        class_weight="balanced"
+    )
+
+    pipeline = ImbPipeline(steps=[
+        ("preproc", preprocessor),
+        ("smote", SMOTE(random_state=42)),
+        ("clf", model)
+    ])
 
 # 7) Fit model
 pipeline.fit(X_train, y_train)
 
 # 8) Evaluate
+# one pass over the test set; labels are what predict() gives (probability > 0.5)
 probs = pipeline.predict_proba(X_test)[:, 1]
-y_pred = pipeline.predict(X_test)
+y_pred = (probs > 0.5).astype(int)
+ev = Evaluation(y_test, probs)
 
-roc = roc_auc_score(y_test, probs)
+roc = ev.roc_auc
 print("ROC AUC:", roc)
 print(classification_report(y_test, y_pred))
 
@@ -108,20 +118,23 @@ print(classification_report(y_test, y_pred))
 df.to_csv("bank_churn_cleaned.csv", index=False)
 
 # b) Save evaluation metrics
-report = classification_report(y_test, y_pred, output_dict=True)
+report = ev.report(0.5, strict=True)
 pd.DataFrame(report).to_csv("model_metrics.csv")
 
 # c) Save trained pipeline
 joblib.dump(pipeline, "bank_churn_model.pkl")
 
 # d) Save ROC curve plot
-RocCurveDisplay.from_estimator(pipeline, X_test, y_test)
+fpr, tpr, _ = ev.roc_curve()
+plt.plot(fpr, tpr, label=f"AUC={roc:.3f}")
+plt.plot([0, 1], [0, 1], "--", color="grey")
+plt.xlabel("False Positive Rate"); plt.ylabel("True Positive Rate"); plt.legend(loc="lower right")
 plt.title(f"ROC Curve (AUC={roc:.3f})")
 plt.savefig("roc_curve.png")
 plt.close()
 
 # e) Save confusion matrix heatmap
-cm = confusion_matrix(y_test, y_pred)
+cm = ev.confusion(0.5, strict=True)
 sns.heatmap(cm, annot=True, fmt="d", cmap="Blues",
             xticklabels=["No Churn", "Churn"],
             yticklabels=["No Churn", "Churn"])
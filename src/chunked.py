@@ -0,0 +1,159 @@
+"""
+chunked.py
+Out-of-core building blocks for train.py --chunksize (two streaming passes over a CSV).
+
+Pass 1, StreamingStats: row / class counts, per-column sums for means and variances,
+category counts, and a bounded random sample per numeric column for the medians.
+Its FusedPreprocessor reproduces build_preprocessor() fitted on the whole file;
+means, variances and categories are exact, medians come from the sample.
+
+Pass 2: every chunk is preprocessed with that FusedPreprocessor and either kept in a
+class-stratified reservoir or used to grow one forest per chunk (merge_forests).
+Memory stays bounded by the chunk, the reservoirs and the model.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from preprocess import FusedPreprocessor
+
+
+class Reservoir:
+    """Uniform sample of at most `capacity` rows from a stream (Algorithm R, vectorized per chunk)."""
+
+    def __init__(self, capacity, rng):
+        self.capacity = int(capacity)
+        self.rng = rng
+        self.seen = 0
+        self.data = None
+        self.size = 0
+
+    def add(self, rows):
+        if len(rows) == 0 or self.capacity == 0:
+            return
+        if self.data is None:
+            self.data = np.empty((self.capacity,) + rows.shape[1:], dtype=rows.dtype)
+        # fill up first, then row i (0-based in the stream) replaces a random slot with prob capacity / (i + 1)
+        take = min(self.capacity - self.size, len(rows))
+        self.data[self.size:self.size + take] = rows[:take]
+        self.size += take
+        rest = rows[take:]
+        if len(rest):
+            stream_idx = self.seen + take + np.arange(len(rest))
+            slots = (self.rng.random_sample(len(rest)) * (stream_idx + 1)).astype(np.int64)
+            keep = slots < self.capacity
+            self.data[slots[keep]] = rest[keep]
+        self.seen += len(rows)
+
+    def values(self):
+        return self.data[:self.size] if self.data is not None else np.empty((0,))
+
+
+class StratifiedReservoir:
+    """One Reservoir per class, sized by the class shares seen in pass 1."""
+
+    def __init__(self, capacity, class_counts, rng):
+        total = sum(class_counts.values())
+        self.reservoirs = {c: Reservoir(max(1, round(capacity * n / total)), rng) for c, n in class_counts.items()}
+
+    def add(self, X, y):
+        for c, res in self.reservoirs.items():
+            res.add(X[y == c])
+
+    def sample(self):
+        parts = [(res.values(), np.full(res.size, c)) for c, res in self.reservoirs.items() if res.size]
+        return np.vstack([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    @property
+    def nbytes(self):
+        return sum(r.data.nbytes for r in self.reservoirs.values() if r.data is not None)
+
+
+class StreamingStats:
+    """Pass-1 statistics for build_preprocessor()'s numeric / categorical columns."""
+
+    def __init__(self, median_sample=100_000, random_state=None):
+        self.median_sample = median_sample
+        self.rng = np.random.RandomState(random_state)
+        self.numeric_feats = None
+        self.categorical_feats = None
+        self.n_rows = 0
+        self.class_counts = Counter()
+
+    def update(self, X: pd.DataFrame, y):
+        if self.numeric_feats is None:
+            self.numeric_feats = X.select_dtypes(include=[np.number]).columns.tolist()
+            self.categorical_feats = X.select_dtypes(include=["object", "category"]).columns.tolist()
+            k = len(self.numeric_feats)
+            self.count = np.zeros(k)
+            self.shift = np.zeros(k)  # first chunk means; keeps the sum of squares well conditioned
+            self.sums = np.zeros(k)
+            self.sumsq = np.zeros(k)
+            self.samples = [Reservoir(self.median_sample, self.rng) for _ in range(k)]
+            self.cat_counts = [Counter() for _ in self.categorical_feats]
+            first = True
+        else:
+            first = False
+
+        num = X[self.numeric_feats].to_numpy(dtype=np.float64)
+        present = ~np.isnan(num)
+        if first:
+            with np.errstate(invalid="ignore"):
+                self.shift = np.nan_to_num(np.nanmean(num, axis=0))
+        d = np.where(present, num - self.shift, 0.0)
+        self.count += present.sum(axis=0)
+        self.sums += d.sum(axis=0)
+        self.sumsq += (d * d).sum(axis=0)
+        for j, res in enumerate(self.samples):
+            res.add(num[present[:, j], j])
+        for j, col in enumerate(self.categorical_feats):
+            self.cat_counts[j].update(X[col].dropna().astype(str).value_counts().to_dict())
+        self.class_counts.update(pd.Series(y).value_counts().to_dict())
+        self.n_rows += len(X)
+
+    def to_preprocessor(self, encoding="onehot"):
+        """FusedPreprocessor equivalent to build_preprocessor(...).fit() on every row seen."""
+        medians = np.array([np.median(r.values()) if r.size else np.nan for r in self.samples])
+        # the scaler sees imputed columns: missing values count as the median
+        n = self.n_rows
+        m = n - self.count
+        dm = medians - self.shift
+        mean_d = (self.sums + m * dm) / n
+        var = (self.sumsq + m * dm * dm) / n - mean_d ** 2
+        var = np.maximum(var, 0.0)
+        scales = np.sqrt(var)
+        scales[scales == 0] = 1.0
+
+        # most frequent category, ties to the smallest value (as SimpleImputer does)
+        fill = [min(c.items(), key=lambda kv: (-kv[1], kv[0]))[0] if c else "missing" for c in self.cat_counts]
+        cats = [np.array(sorted(c), dtype=str) for c in self.cat_counts]
+        names = [f"num__{c}" for c in self.numeric_feats]
+        if encoding == "onehot":
+            names += [f"cat__{col}_{v}" for col, cs in zip(self.categorical_feats, cats) for v in cs]
+        else:
+            names += [f"cat__{col}" for col in self.categorical_feats]
+        return FusedPreprocessor(
+            encoding=encoding,
+            numeric_feats=self.numeric_feats,
+            categorical_feats=self.categorical_feats,
+            medians=medians,
+            means=self.shift + mean_d,
+            scales=scales,
+            fill_values=fill,
+            categories=np.concatenate(cats) if cats else np.array([], dtype=str),
+            cat_offsets=np.cumsum([0] + [len(c) for c in cats]),
+            feature_names=names,
+        )
+
+
+def merge_forests(forests):
+    """One RandomForestClassifier holding the trees of all per-chunk forests."""
+    merged = forests[0]
+    for f in forests[1:]:
+        if not np.array_equal(f.classes_, merged.classes_):
+            raise ValueError("Per-chunk forests were fitted on different classes; use larger chunks")
+        merged.estimators_ += f.estimators_
+    merged.set_params(n_estimators=len(merged.estimators_))
+    return merged
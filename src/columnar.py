@@ -0,0 +1,136 @@
+"""
+columnar.py
+Columnar (Parquet) copies of the CSV inputs and outputs.
+
+read_cached() serves a CSV from a Parquet copy next to it (data/.bank_churn_cleaned.csv.<tag>.parquet),
+written on the first read and keyed by the CSV's size and mtime. Later script and dashboard starts
+skip the text parse and read only the columns they ask for (usecols). The tag names the parser,
+so the schema-typed frame from preprocess.read_churn_csv and a plain read_csv are cached apart.
+
+write_table() writes outputs as <name>.parquet, with the CSV as an optional export; read_table()
+takes either name and serves the newer file. Without pyarrow everything falls back to CSV;
+CHURN_CSV_CACHE=0 turns the read cache off.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # plain CSV reads and writes
+    pa = pq = None
+
+SOURCE_KEY = b"churn_source_key"
+
+
+def cache_enabled():
+    return pq is not None and os.environ.get("CHURN_CSV_CACHE", "1") != "0"
+
+
+def cache_path(path, tag):
+    """data/x.csv -> data/.x.csv.<tag>.parquet"""
+    head, name = os.path.split(path)
+    return os.path.join(head, f".{name}.{tag}.parquet")
+
+
+def source_key(path):
+    """Size + mtime of the CSV; raises FileNotFoundError like read_csv."""
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}".encode()
+
+
+def _project(columns, usecols):
+    """read_csv usecols (names or a callable) -> the columns to read, in file order."""
+    if usecols is None:
+        return None
+    if callable(usecols):
+        return [c for c in columns if usecols(c)]
+    missing = set(usecols) - set(columns)
+    if missing:
+        raise ValueError(f"Usecols do not match columns, columns expected but not found: {sorted(missing)}")
+    return [c for c in columns if c in set(usecols)]
+
+
+def _store(df, cache, key):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SOURCE_KEY: key})
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    try:
+        pq.write_table(table, tmp)
+        os.replace(tmp, cache)  # atomic: a dashboard starting alongside never sees half a file
+    except OSError:  # read-only data directory: serve uncached
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_parquet(path, usecols=None, chunksize=None):
+    columns = _project(pq.read_schema(path).names, usecols)
+    if chunksize is None:
+        return pd.read_parquet(path, columns=columns)
+
+    def chunks():
+        start = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            df = pa.Table.from_batches([batch]).to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))  # continue the row numbers like read_csv chunks
+            start += len(df)
+            yield df
+    return chunks()
+
+
+def read_cached(path, parse, tag, usecols=None, chunksize=None):
+    """parse(path, usecols=, chunksize=) -> DataFrame (or chunk iterator), served from the Parquet copy.
+
+    A missing or stale copy is rebuilt from a full parse; chunked reads stream from a fresh
+    copy but never build one, since that would hold the whole file in memory.
+    """
+    key = source_key(path)
+    if cache_enabled():
+        cache = cache_path(path, tag)
+        try:
+            fresh = (pq.read_schema(cache).metadata or {}).get(SOURCE_KEY) == key
+        except (OSError, pa.ArrowInvalid):
+            fresh = False
+        if fresh:
+            return _read_parquet(cache, usecols, chunksize)
+        if chunksize is None:
+            df = parse(path)
+            _store(df, cache, key)
+            return df if usecols is None else df[_project(df.columns, usecols)]
+    return parse(path, usecols=usecols, chunksize=chunksize)
+
+
+def read_table(path, usecols=None, chunksize=None, **kwargs):
+    """pd.read_csv through the cache. A .parquet path is read directly, and so is the write_table
+    Parquet output for a .csv path when it is newer than the CSV (or there is no CSV).
+    Other read_csv options bypass the cache."""
+    stem, ext = os.path.splitext(path)
+    parquet = stem + ".parquet"
+    if pq is not None and ext == ".csv" and os.path.exists(parquet) and (
+            not os.path.exists(path) or os.path.getmtime(parquet) > os.path.getmtime(path)):
+        path, ext = parquet, ".parquet"
+    if ext == ".parquet":
+        return _read_parquet(path, usecols, chunksize)
+    if kwargs:
+        return pd.read_csv(path, usecols=usecols, chunksize=chunksize, **kwargs)
+    return read_cached(path, pd.read_csv, "csv", usecols=usecols, chunksize=chunksize)
+
+
+def write_table(df, path, csv=False, index=False):
+    """Write df to <path stem>.parquet, and to path as CSV when csv=True (always without pyarrow).
+
+    A CSV already at path is left alone when not re-exported; read_table serves whichever of the
+    two is newer. Returns the files written.
+    """
+    stem = os.path.splitext(path)[0]
+    written = []
+    if pq is not None:
+        out = stem + ".parquet"
+        df.to_parquet(out, index=index)
+        written.append(out)
+    if csv or pq is None:
+        df.to_csv(path, index=index)
+        written.append(path)
+    return written
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+compact.py
+Post-training compaction of the RandomForest in models/best_model.pkl.
+
+1) export the forest to flat arrays (forest_engine.CompactForest)
+2) store leaf values as float16 (or float32) and feature ids as int16
+3) collapse subtrees whose leaves span at most --collapse_tol in stored value into one leaf.
+   The default 0 only folds exactly uniform subtrees, which leaves every prediction unchanged
+   but is usually a no-op: sklearn does not split a node whose children would agree, so such
+   subtrees only appear where float16 rounding merges leaf values. Near-uniform subtrees
+   (--collapse_tol > 0) are where the node savings are, at some AUC cost.
+4) drop trees from the end while AUC on a pruning half of the test split stays within --auc_tol
+   of the full forest; the other half is only used for the reported deltas
+
+Writes a pipeline (same preproc + the compact forest as "clf") that predict.py,
+explain.py and scoring.py load like best_model.pkl, plus a size / load-time / AUC report.
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+import joblib
+
+from imblearn.pipeline import Pipeline as ImbPipeline
+from sklearn.model_selection import train_test_split
+
+from evaluation import roc_auc
+from forest_engine import CompactForest
+from preprocess import read_churn_csv
+
+
+def _collapse_tree(feature, threshold, right, value, cover, tol=0.0):
+    """One tree (node ids relative to its root) with near-uniform subtrees folded into leaves.
+
+    A subtree collapses when its leaf values span at most tol; the new leaf gets the
+    cover-weighted mean (the shared value itself when tol == 0, so nothing changes).
+    """
+    n = len(feature)
+    leaf = right == np.arange(n)
+    weight = np.ones(n) if cover is None else cover.astype(np.float64)
+    lo = value.astype(np.float64)
+    hi = lo.copy()
+    mass = lo * weight  # sum of cover * leaf value under each node
+    w = weight.copy()
+    # reverse preorder visits both children before their parent
+    for i in range(n - 1, -1, -1):
+        if not leaf[i]:
+            l, r = i + 1, right[i]
+            lo[i], hi[i] = min(lo[l], lo[r]), max(hi[l], hi[r])
+            mass[i], w[i] = mass[l] + mass[r], w[l] + w[r]
+    uniform = hi - lo <= tol
+    leaf_value = np.where(lo == hi, lo, mass / w).astype(value.dtype)
+
+    order, stack = [], [0]
+    while stack:
+        i = stack.pop()
+        order.append(i)
+        if not (uniform[i] or leaf[i]):
+            stack.append(right[i])
+            stack.append(i + 1)
+    order = np.asarray(order)
+    new_id = np.full(n, -1)
+    new_id[order] = np.arange(len(order))
+    is_leaf = uniform[order] | leaf[order]
+    new_right = np.where(is_leaf, np.arange(len(order)), new_id[right[order]])
+    return (np.where(is_leaf, 0, feature[order]),
+            np.where(is_leaf, np.float32(-np.inf), threshold[order]),
+            new_right,
+            np.where(is_leaf, leaf_value[order], value[order]),
+            None if cover is None else cover[order])
+
+
+def collapse_subtrees(forest, tol=0.0):
+    """(forest with uniform subtrees collapsed, number of nodes removed)."""
+    parts = {k: [] for k in ("feature", "threshold", "right", "value", "cover")}
+    roots, offset = [], 0
+    for t in range(forest.n_trees):
+        start, stop = forest.tree_bounds(t)
+        cover = None if forest.cover is None else forest.cover[start:stop]
+        tree = _collapse_tree(forest.feature[start:stop], forest.threshold[start:stop],
+                              forest.right[start:stop] - start, forest.value[start:stop], cover, tol)
+        for k, a in zip(parts, tree):
+            if a is not None:
+                parts[k].append(a)
+        parts["right"][-1] = parts["right"][-1] + offset
+        roots.append(offset)
+        offset += len(tree[0])
+
+    cat = {k: np.concatenate(v).astype(getattr(forest, k).dtype) if v else None for k, v in parts.items()}
+    collapsed = CompactForest(roots=np.asarray(roots, dtype=forest.roots.dtype), depth=forest.depth,
+                              n_features_in=forest.n_features_in_, classes=forest.classes_, **cat)
+    return collapsed, forest.n_nodes - collapsed.n_nodes
+
+
+def quantize(forest, value_dtype="float16"):
+    """Narrow storage dtypes: leaf values, feature ids (int16 when they fit), child ids."""
+    feature_dtype = np.int16 if forest.n_features_in_ < np.iinfo(np.int16).max else np.int32
+    return CompactForest(
+        feature=forest.feature.astype(feature_dtype),
+        threshold=forest.threshold.astype(np.float32),
+        right=forest.right.astype(np.int32),
+        value=forest.value.astype(value_dtype),
+        roots=forest.roots.astype(np.int32),
+        depth=forest.depth,
+        n_features_in=forest.n_features_in_,
+        classes=forest.classes_,
+        cover=None if forest.cover is None else forest.cover.astype(np.float32),
+    )
+
+
+def drop_trees(forest, X, y, auc_tol=0.001, min_trees=10):
+    """(kept tree ids, full AUC, kept AUC) on the pruning rows X, y.
+
+    Forest trees are exchangeable, so trees are dropped from the end in fitted order
+    (no per-tree selection to overfit the pruning rows) until the next drop would take
+    AUC below full - auc_tol.
+    """
+    P = forest.tree_values(X).astype(np.float64)
+    remaining = P.sum(axis=1)
+    full_auc = kept_auc = roc_auc(y, remaining)
+    n_keep = forest.n_trees
+    while n_keep > min_trees:
+        remaining -= P[:, n_keep - 1]
+        auc = roc_auc(y, remaining)
+        if auc < full_auc - auc_tol:
+            break
+        n_keep, kept_auc = n_keep - 1, auc
+    return np.arange(n_keep), full_auc, kept_auc
+
+
+def load_seconds(path, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        joblib.load(path)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(args):
+    # 1) the held-out split train.py used, halved into pruning / reporting rows
+    # typed like train.py's read, without the ID and the leftover Naive Bayes columns
+    df = read_churn_csv(args.data, usecols=lambda c: c != "CLIENTNUM" and not c.startswith("Naive_Bayes_Classifier"))
+    X = df.drop("Attrition_Flag", axis=1)
+    y = df["Attrition_Flag"].astype(object).map({"Existing Customer": 0, "Attrited Customer": 1})
+    _, X_test, _, y_test = train_test_split(X, y, test_size=args.test_size, stratify=y, random_state=args.random_state)
+    X_prune, X_eval, y_prune, y_eval = train_test_split(
+        X_test, y_test, test_size=0.5, stratify=y_test, random_state=args.random_state
+    )
+
+    pipeline = joblib.load(args.model)
+    preproc = pipeline.named_steps["preproc"]
+    clf = pipeline.named_steps["clf"]
+    if not hasattr(clf, "estimators_") or not hasattr(clf, "n_estimators"):
+        raise SystemExit(f"Compaction needs a RandomForest model, got {type(clf).__name__}")
+    Xp = preproc.transform(X_prune)
+    Xe = preproc.transform(X_eval)
+
+    # 2) export + narrow dtypes, 3) collapse uniform subtrees
+    forest = CompactForest.from_sklearn(clf)
+    exported_nodes = forest.n_nodes
+    forest, n_collapsed = collapse_subtrees(quantize(forest, args.value_dtype), args.collapse_tol)
+    print(f"Collapsed {n_collapsed} of {exported_nodes} nodes in uniform subtrees")
+    if n_collapsed == 0 and args.collapse_tol == 0:
+        print("  (exact collapse rarely finds uniform subtrees in a sklearn forest; try --collapse_tol 0.1)")
+
+    # 4) drop trees within the AUC tolerance
+    keep, prune_auc_full, prune_auc_kept = drop_trees(forest, Xp, y_prune.values, args.auc_tol, args.min_trees)
+    forest = forest.subset(keep)
+    print(f"Kept {forest.n_trees} of {clf.n_estimators} trees "
+          f"(pruning AUC {prune_auc_full:.4f} -> {prune_auc_kept:.4f})")
+
+    compact = ImbPipeline(steps=[("preproc", preproc), ("clf", forest)])
+    out_path = args.out or os.path.splitext(args.model)[0] + "_compact.pkl"
+    joblib.dump(compact, out_path)
+
+    # 5) report
+    auc_before = roc_auc(y_eval, clf.predict_proba(Xe)[:, 1])
+    auc_after = roc_auc(y_eval, forest.predict_proba(Xe)[:, 1])
+    report = {
+        "model": os.path.abspath(args.model),
+        "compact_model": os.path.abspath(out_path),
+        "value_dtype": args.value_dtype,
+        "auc_tol": args.auc_tol,
+        "collapse_tol": args.collapse_tol,
+        "n_trees": {"before": int(clf.n_estimators), "after": int(forest.n_trees)},
+        "n_nodes": {"before": int(exported_nodes), "after": int(forest.n_nodes), "collapsed": int(n_collapsed)},
+        "size_mb": {"before": os.path.getsize(args.model) / 1e6, "after": os.path.getsize(out_path) / 1e6},
+        "load_seconds": {"before": load_seconds(args.model), "after": load_seconds(out_path)},
+        "eval_roc_auc": {"before": auc_before, "after": auc_after, "delta": auc_after - auc_before},
+        "n_eval_rows": int(len(y_eval)),
+    }
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for key in ("size_mb", "load_seconds"):
+        r = report[key]
+        print(f"{key:<13} {r['before']:>10.3f} -> {r['after']:>10.3f}  ({r['before'] / r['after']:.1f}x smaller)")
+    r = report["eval_roc_auc"]
+    print(f"{'eval ROC AUC':<13} {r['before']:>10.4f} -> {r['after']:>10.4f}  (delta {r['delta']:+.4f})")
+    print(f"Saved compact model: {out_path}")
+    print(f"Saved report: {args.report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="models/best_model.pkl")
+    parser.add_argument("--data", type=str, default="data/bank_churn_cleaned.csv")
+    parser.add_argument("--out", type=str, default=None, help="Default: <model>_compact.pkl")
+    parser.add_argument("--report", type=str, default="outputs/compaction.json")
+    parser.add_argument("--test_size", type=float, default=0.20, help="Must match train.py")
+    parser.add_argument("--random_state", type=int, default=42, help="Must match train.py")
+    parser.add_argument("--auc_tol", type=float, default=0.001, help="Allowed pruning-AUC loss from dropping trees")
+    parser.add_argument("--min_trees", type=int, default=10)
+    parser.add_argument("--collapse_tol", type=float, default=0.0, help="Max leaf-value spread of a collapsed subtree (0: exact only, usually nothing to collapse)")
+    parser.add_argument("--value_dtype", choices=["float16", "float32"], default="float16")
+    args = parser.parse_args()
+    main(args)
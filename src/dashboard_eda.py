@@ -13,6 +13,8 @@ import os
 import math
 from pathlib import Path
 
+from preprocess import read_churn_csv
+
 # Set style for better-looking plots
 plt.style.use('default')
 sns.set_palette("husl")
@@ -25,9 +27,9 @@ def clean_for_json(obj):
         return [clean_for_json(v) for v in obj]
     elif isinstance(obj, np.ndarray):
         return clean_for_json(obj.tolist())
-    elif isinstance(obj, (np.int64, np.int32)):
+    elif isinstance(obj, np.integer):
         return int(obj)
-    elif isinstance(obj, (np.float64, np.float32)):
+    elif isinstance(obj, np.floating):
         if math.isnan(obj) or math.isinf(obj):
             return None
         return float(obj)
@@ -44,19 +46,16 @@ def load_and_clean_data():
     """Load and clean the raw bank churners data"""
     print("📊 Loading and cleaning data...")
     
-    # Load data
-    df = pd.read_csv("../data/raw_BankChurners.csv")
-    
-    # Remove Naive Bayes columns (synthetic features)
-    df = df.drop(columns=[col for col in df.columns if col.startswith("Naive_Bayes")])
+    # Load data with the shared dtype plan, skipping the Naive Bayes columns (synthetic features)
+    df = read_churn_csv("../data/raw_BankChurners.csv", usecols=lambda col: not col.startswith("Naive_Bayes"))
     
     # Create binary churn flag
     df['Churned'] = (df['Attrition_Flag'] == 'Attrited Customer').astype(int)
     
     # Clean categorical variables
-    df['Income_Category'] = df['Income_Category'].replace('Unknown', 'Unknown Income')
-    df['Education_Level'] = df['Education_Level'].replace('Unknown', 'Unknown Education')
-    df['Marital_Status'] = df['Marital_Status'].replace('Unknown', 'Unknown Status')
+    df['Income_Category'] = df['Income_Category'].cat.rename_categories({'Unknown': 'Unknown Income'})
+    df['Education_Level'] = df['Education_Level'].cat.rename_categories({'Unknown': 'Unknown Education'})
+    df['Marital_Status'] = df['Marital_Status'].cat.rename_categories({'Unknown': 'Unknown Status'})
     
     print(f"✅ Data loaded: {len(df):,} customers, {df['Churned'].sum():,} churned ({df['Churned'].mean():.1%})")
     return df
@@ -85,12 +84,12 @@ def churn_overview_analysis(df):
     results['churn_by_age'] = age_churn.to_dict('index')
     
     # Churn by income category
-    income_churn = df.groupby('Income_Category')['Churned'].agg(['count', 'sum', 'mean']).round(3)
+    income_churn = df.groupby('Income_Category', observed=True)['Churned'].agg(['count', 'sum', 'mean']).round(3)
     income_churn.columns = ['Total_Customers', 'Churned_Count', 'Churn_Rate']
     results['churn_by_income'] = income_churn.to_dict('index')
     
     # Churn by card type
-    card_churn = df.groupby('Card_Category')['Churned'].agg(['count', 'sum', 'mean']).round(3)
+    card_churn = df.groupby('Card_Category', observed=True)['Churned'].agg(['count', 'sum', 'mean']).round(3)
     card_churn.columns = ['Total_Customers', 'Churned_Count', 'Churn_Rate']
     results['churn_by_card_type'] = card_churn.to_dict('index')
     
@@ -122,17 +121,17 @@ def demographics_analysis(df):
     results = {}
     
     # Churn by gender
-    gender_churn = df.groupby('Gender')['Churned'].agg(['count', 'sum', 'mean']).round(3)
+    gender_churn = df.groupby('Gender', observed=True)['Churned'].agg(['count', 'sum', 'mean']).round(3)
     gender_churn.columns = ['Total_Customers', 'Churned_Count', 'Churn_Rate']
     results['churn_by_gender'] = gender_churn.to_dict('index')
     
     # Churn by education level
-    education_churn = df.groupby('Education_Level')['Churned'].agg(['count', 'sum', 'mean']).round(3)
+    education_churn = df.groupby('Education_Level', observed=True)['Churned'].agg(['count', 'sum', 'mean']).round(3)
     education_churn.columns = ['Total_Customers', 'Churned_Count', 'Churn_Rate']
     results['churn_by_education'] = education_churn.to_dict('index')
     
     # Churn by marital status
-    marital_churn = df.groupby('Marital_Status')['Churned'].agg(['count', 'sum', 'mean']).round(3)
+    marital_churn = df.groupby('Marital_Status', observed=True)['Churned'].agg(['count', 'sum', 'mean']).round(3)
     marital_churn.columns = ['Total_Customers', 'Churned_Count', 'Churn_Rate']
     results['churn_by_marital_status'] = marital_churn.to_dict('index')
     
@@ -282,7 +281,7 @@ def customer_value_analysis(df):
     }
     
     # Card tier and income analysis
-    card_income_churn = df.groupby(['Card_Category', 'Income_Category'])['Churned'].agg(['count', 'mean']).round(3)
+    card_income_churn = df.groupby(['Card_Category', 'Income_Category'], observed=True)['Churned'].agg(['count', 'mean']).round(3)
     card_income_churn.columns = ['Customer_Count', 'Churn_Rate']
     # Convert multi-index to string keys for JSON serialization
     card_income_dict = {}
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+distill.py
+Distil the trained RandomForest (teacher) into a small, fast student for serving.
+
+1) rebuild train.py's train/test split
+2) augment the training rows with synthetic points: each copy takes every feature
+   group (a numeric column or a whole one-hot block) from a random other row with
+   probability --swap_prob, and numerics get Gaussian noise of --noise std devs
+3) label real + synthetic rows with the teacher's P(churn)
+4) fit the student regressor on those soft labels:
+   - gbm:  shallow gradient-boosted trees (default)
+   - tree: one depth-limited decision tree
+5) report fidelity on the test split (Spearman rank correlation, top-decile agreement,
+   AUC of both) and the scoring speedup, and save models/best_model_student.pkl
+6) attach the student to the registry version holding this teacher (found by its
+   model.pkl, or --version), so bundles only ever pair a student with its own teacher
+
+predict.py --student scores with the student instead of the teacher.
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import time
+import numpy as np
+import joblib
+
+from imblearn.pipeline import Pipeline as ImbPipeline
+from scipy.stats import spearmanr
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeRegressor
+
+from evaluation import roc_auc
+from forest_engine import CompactForest
+from preprocess import FusedPreprocessor, read_churn_csv
+from registry import DEFAULT_REGISTRY, MODEL_FILE, get_registry
+from student import DistilledClassifier, student_path
+
+
+def feature_groups(fused):
+    """Output-column slices that are sampled together (one per raw feature)."""
+    n_num = len(fused.numeric_feats)
+    groups = [slice(j, j + 1) for j in range(n_num)]
+    if fused.encoding == "onehot":
+        offs = fused.cat_offsets
+        groups += [slice(n_num + offs[j], n_num + offs[j + 1]) for j in range(len(fused.categorical_feats))]
+    else:
+        groups += [slice(n_num + j, n_num + j + 1) for j in range(len(fused.categorical_feats))]
+    return groups
+
+
+def synthesize(X, groups, n_numeric, n_copies=3, swap_prob=0.3, noise=0.1, random_state=None):
+    """n_copies * len(X) synthetic rows around X (feature-group swaps + numeric noise)."""
+    rng = np.random.RandomState(random_state)
+    synth = np.repeat(X, n_copies, axis=0)
+    donors = X[rng.randint(len(X), size=len(synth))]
+    for g in groups:
+        swap = rng.rand(len(synth)) < swap_prob
+        synth[swap, g] = donors[swap, g]
+    # numerics are standardised for onehot; for ordinal, scale noise by the column spread
+    std = X[:, :n_numeric].std(axis=0)
+    synth[:, :n_numeric] += rng.randn(len(synth), n_numeric) * noise * np.where(std > 0, std, 1.0)
+    return synth
+
+
+def build_student(kind, max_depth, n_estimators, random_state):
+    if kind == "tree":
+        reg = DecisionTreeRegressor(max_depth=max_depth, min_samples_leaf=5, random_state=random_state)
+    else:
+        reg = GradientBoostingRegressor(n_estimators=n_estimators, max_depth=max_depth, learning_rate=0.1,
+                                        subsample=0.8, random_state=random_state)
+    return DistilledClassifier(reg)
+
+
+def top_decile_agreement(teacher, student, frac=0.10):
+    """Share of the teacher's top-frac customers that the student also puts in its top-frac."""
+    k = max(1, int(np.ceil(frac * len(teacher))))
+    top_t = set(np.argsort(-teacher, kind="stable")[:k])
+    top_s = set(np.argsort(-student, kind="stable")[:k])
+    return len(top_t & top_s) / k
+
+
+def best_seconds(fn, X, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(X)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(args):
+    # 1) same split as train.py
+    # typed like train.py's read, without the ID and the leftover Naive Bayes columns
+    df = read_churn_csv(args.data, usecols=lambda c: c != "CLIENTNUM" and not c.startswith("Naive_Bayes_Classifier"))
+    X = df.drop("Attrition_Flag", axis=1)
+    y = df["Attrition_Flag"].astype(object).map({"Existing Customer": 0, "Attrited Customer": 1})
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=args.test_size, stratify=y, random_state=args.random_state
+    )
+
+    teacher = joblib.load(args.model)
+    preproc = teacher.named_steps["preproc"]
+    fused = FusedPreprocessor.from_column_transformer(preproc)
+    Xt = fused.transform(X_train)
+    teacher_clf = teacher.named_steps["clf"]
+    # array-backed forest labels the augmented set much faster than sklearn (same probabilities)
+    label = CompactForest.from_sklearn(teacher_clf) if hasattr(teacher_clf, "estimators_") else teacher_clf
+
+    # 2) synthetic points, 3) soft labels
+    synth = synthesize(Xt, feature_groups(fused), len(fused.numeric_feats), args.n_copies,
+                       args.swap_prob, args.noise, args.random_state)
+    X_aug = np.vstack([Xt, synth])
+    p_aug = label.predict_proba(X_aug)[:, 1]
+    print(f"Distillation set: {len(Xt)} real + {len(synth)} synthetic rows")
+
+    # 4) student
+    student_clf = build_student(args.student, args.max_depth, args.n_estimators, args.random_state)
+    t0 = time.perf_counter()
+    student_clf.fit(X_aug, p_aug)
+    fit_seconds = time.perf_counter() - t0
+    student = ImbPipeline(steps=[("preproc", preproc), ("clf", student_clf)])
+    out_path = args.out or student_path(args.model)
+    joblib.dump(student, out_path)
+
+    # 5) fidelity + speed on the test split
+    p_teacher = teacher.predict_proba(X_test)[:, 1]
+    p_student = student.predict_proba(X_test)[:, 1]
+    if hasattr(teacher_clf, "n_jobs"):
+        teacher_clf.n_jobs = 1  # per-core comparison
+    teacher_s = best_seconds(teacher.predict_proba, X_test)
+    student_s = best_seconds(student.predict_proba, X_test)
+    teacher_1 = best_seconds(teacher.predict_proba, X_test.head(1), repeat=20)
+    student_1 = best_seconds(student.predict_proba, X_test.head(1), repeat=20)
+    report = {
+        "teacher": os.path.abspath(args.model),
+        "student": os.path.abspath(out_path),
+        "student_kind": args.student,
+        "student_params": {"max_depth": args.max_depth, "n_estimators": args.n_estimators},
+        "n_real": int(len(Xt)),
+        "n_synthetic": int(len(synth)),
+        "fit_seconds": fit_seconds,
+        "spearman": float(spearmanr(p_teacher, p_student).correlation),
+        "top_decile_agreement": top_decile_agreement(p_teacher, p_student),
+        "roc_auc": {"teacher": roc_auc(y_test, p_teacher), "student": roc_auc(y_test, p_student)},
+        "batch_seconds": {"teacher": teacher_s, "student": student_s, "speedup": teacher_s / student_s},
+        "single_row_seconds": {"teacher": teacher_1, "student": student_1, "speedup": teacher_1 / student_1},
+        "size_mb": {"teacher": os.path.getsize(args.model) / 1e6, "student": os.path.getsize(out_path) / 1e6},
+    }
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Spearman rank correlation: {report['spearman']:.4f}")
+    print(f"Top-decile agreement:      {report['top_decile_agreement']:.3f}")
+    print(f"ROC AUC teacher / student: {report['roc_auc']['teacher']:.4f} / {report['roc_auc']['student']:.4f}")
+    print(f"Speedup (test batch):      {report['batch_seconds']['speedup']:.1f}x")
+    print(f"Speedup (single row):      {report['single_row_seconds']['speedup']:.1f}x")
+    print(f"Size teacher / student:    {report['size_mb']['teacher']:.2f}MB / {report['size_mb']['student']:.2f}MB")
+    print(f"Saved student model: {out_path}")
+    print(f"Saved report: {args.report}")
+
+    # 6) store the student with its teacher
+    registry = get_registry(args.registry)
+    version = args.version or registry.find_model(args.model)
+    if version is None:
+        print(f"Teacher {args.model} is not a version in {args.registry}; student not attached")
+    elif not filecmp.cmp(os.path.join(registry.root, version, MODEL_FILE), args.model, shallow=False):
+        raise SystemExit(f"Registry version {version} holds a different model than the teacher {args.model}")
+    else:
+        registry.attach(version, {"model_student.pkl": out_path})
+        print(f"Attached student to registry version {version}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="models/best_model.pkl", help="Teacher pipeline")
+    parser.add_argument("--data", type=str, default="data/bank_churn_cleaned.csv")
+    parser.add_argument("--out", type=str, default=None, help="Default: <model>_student.pkl")
+    parser.add_argument("--report", type=str, default="outputs/distillation.json")
+    parser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY)
+    parser.add_argument("--version", type=str, default=None,
+                        help="Registry version to attach the student to (default: the one holding --model)")
+    parser.add_argument("--test_size", type=float, default=0.20, help="Must match train.py")
+    parser.add_argument("--random_state", type=int, default=42, help="Must match train.py")
+    parser.add_argument("--student", choices=["gbm", "tree"], default="gbm")
+    parser.add_argument("--max_depth", type=int, default=5)
+    parser.add_argument("--n_estimators", type=int, default=150, help="Boosting rounds (gbm)")
+    parser.add_argument("--n_copies", type=int, default=3, help="Synthetic copies per training row")
+    parser.add_argument("--swap_prob", type=float, default=0.3)
+    parser.add_argument("--noise", type=float, default=0.1)
+    args = parser.parse_args()
+    main(args)
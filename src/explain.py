@@ -2,9 +2,11 @@
 """
 Explain churn predictions using SHAP.
 
-Outputs in outputs/explanations:
-- per_customer_reasons.csv: top positive SHAP reasons per customer
-- shap_values_summary_by_income.csv: mean |SHAP| per feature within Income_Category
+Outputs in outputs/explanations (Parquet; --csv also writes the .csv files):
+- per_customer_reasons.parquet: top positive SHAP reasons per customer
+- predictions_with_reasons.parquet + .csv: input rows with probability, label and reasons
+  (always also CSV, which the React UI fetches)
+- shap_values_summary_by_income.parquet: mean |SHAP| per feature within Income_Category
 - plots: bar charts per income group and example waterfall plots
 """
 
@@ -13,11 +15,14 @@ import argparse
 import json
 import numpy as np
 import pandas as pd
-import joblib
 import shap
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from columnar import write_table
+from preprocess import read_churn_csv
+from registry import Bundle, DEFAULT_REGISTRY, get_model
+
 
 def get_feature_names_from_preprocessor(preproc) -> list:
     try:
@@ -31,17 +36,25 @@ def get_feature_names_from_preprocessor(preproc) -> list:
         return None
 
 
-def compute_shap_for_pipeline(pipeline, X: pd.DataFrame):
+def tree_explainer(model):
+    # compacted forests (compact.py) describe themselves as a shap model dict
+    if hasattr(model, "to_shap_dict"):
+        return shap.TreeExplainer(model.to_shap_dict())
+    return shap.TreeExplainer(model)
+
+
+def compute_shap_for_pipeline(pipeline, X: pd.DataFrame, X_trans=None):
     # Access steps
     preproc = pipeline.named_steps.get("preproc")
     model = pipeline.named_steps.get("clf")
 
-    # Transform features like during training
-    X_trans = preproc.transform(X)
+    # Transform features like during training (unless already transformed)
+    if X_trans is None:
+        X_trans = preproc.transform(X)
     feature_names = get_feature_names_from_preprocessor(preproc)
 
     # Build TreeExplainer for tree-based model
-    explainer = shap.TreeExplainer(model)
+    explainer = tree_explainer(model)
     shap_values = explainer.shap_values(X_trans)
 
     # If list per class, take class 1 (churn)
@@ -87,7 +100,7 @@ def top_positive_reasons(shap_row: np.ndarray, feature_names: list, top_k: int =
 def summarize_by_income(abs_shap: np.ndarray, feature_names: list, income_series: pd.Series, top_n: int = 10):
     df_abs = pd.DataFrame(abs_shap, columns=feature_names)
     df_abs["Income_Category"] = income_series.values
-    grouped = df_abs.groupby("Income_Category").mean(numeric_only=True)
+    grouped = df_abs.groupby("Income_Category", observed=True).mean(numeric_only=True)
     summaries = {}
     for income_cat, row in grouped.iterrows():
         s = row.sort_values(ascending=False).head(top_n)
@@ -162,13 +175,18 @@ def build_reason_comment(top_reasons: list) -> str:
     return f"Likely drivers: {phrases[0]}, {phrases[1]}, and {phrases[2]}."
 
 
-def get_base_feature_name(feature_name: str) -> str:
+def get_base_feature_name(feature_name: str, categorical_feats=None) -> str:
     # Remove pipeline prefixes and one-hot category suffixes where possible
     name = feature_name
     if name.startswith("num__"):
         return name[len("num__"):]
     if name.startswith("cat__"):
         trimmed = name[len("cat__"):]
+        # known columns: ordinal names are the column itself, one-hot names are column + "_" + category
+        if categorical_feats:
+            for col in sorted(categorical_feats, key=len, reverse=True):
+                if trimmed == col or trimmed.startswith(col + "_"):
+                    return col
         # drop last category token for one-hot columns
         if "_" in trimmed:
             return trimmed.rsplit("_", 1)[0]
@@ -176,6 +194,22 @@ def get_base_feature_name(feature_name: str) -> str:
     return name
 
 
+def decode_ordinal_reasons(reasons, row, fused):
+    """Ordinal models: "cat__Income_Category" -> "cat__Income_Category_<customer's category>" (one-hot style)."""
+    if fused is None or fused.encoding != "ordinal":
+        return reasons
+    n_num = len(fused.numeric_feats)
+    columns = {f"cat__{col}": j for j, col in enumerate(fused.categorical_feats)}
+    decoded = []
+    for r in reasons:
+        j = columns.get(r["feature"])
+        if j is not None:
+            label = fused.decode(j, [row[n_num + j]])[0]
+            r = {**r, "feature": f"{r['feature']}_{label}"}
+        decoded.append(r)
+    return decoded
+
+
 def describe_reason(base, shap_val):
     """Generate business-oriented explanations based on feature and SHAP value direction"""
 
@@ -246,8 +280,10 @@ def main(args):
     os.makedirs(exp_dir, exist_ok=True)
 
     # Load pipeline and data
-    pipeline = joblib.load(args.model)
-    data = pd.read_csv(args.data)
+    # registry version (default: latest) or an explicit pickle with --model
+    bundle = Bundle.from_model_path(args.model) if args.model else get_model(args.version, args.registry)
+    pipeline = bundle.model
+    data = read_churn_csv(args.data)
 
     # If Attrition_Flag exists, drop it to simulate prediction-time features
     if "Attrition_Flag" in data.columns:
@@ -261,35 +297,41 @@ def main(args):
         columns=[c for c in data_features.columns if c.startswith("Naive_Bayes_Classifier")], errors="ignore"
     )
 
+    # Transform once (fused NumPy kernel when train.py exported one) and reuse below
+    X_trans = bundle.transform(data_features)
+
     # Compute SHAP values on transformed features
-    shap_pos, base_value, feature_names = compute_shap_for_pipeline(pipeline, data_features)
+    shap_pos, base_value, feature_names = compute_shap_for_pipeline(pipeline, data_features, X_trans)
     if feature_names is None:
         feature_names = [f"feat_{i}" for i in range(shap_pos.shape[1])]
 
     # Predicted churn probability to align reasons toward churn
-    probs = pipeline.predict_proba(data_features)[:, 1]
+    probs = pipeline.named_steps["clf"].predict_proba(X_trans)[:, 1]
     high_risk = (probs >= args.threshold).astype(int)
 
     # Build per-customer reasons table ONLY for churn (Predicted_Label==1)
     churn_indices = np.where(high_risk == 1)[0]
     records = []
+    cat_feats = bundle.fused.categorical_feats if bundle.fused is not None else None
     for idx in churn_indices:
         reasons = top_positive_reasons(shap_pos[idx], feature_names, top_k=args.top_k)
+        # ordinal codes read back as categories via the mapping table
+        reasons = decode_ordinal_reasons(reasons, X_trans[idx], bundle.fused)
         # Enrich reasons with business-oriented descriptions
         enriched = []
         for r in reasons:
-            base = get_base_feature_name(r["feature"])
+            base = get_base_feature_name(r["feature"], cat_feats)
             r_desc = describe_reason(base, r["shap_value"])
             enriched.append({**r, "reason": r_desc})
         # Build natural language comment
         reason_comment = build_reason_comment(reasons)
-        key_factors = "; ".join([describe_reason(get_base_feature_name(r['feature']), r['shap_value']) for r in reasons])
+        key_factors = "; ".join([describe_reason(get_base_feature_name(r['feature'], cat_feats), r['shap_value']) for r in reasons])
         records.append({
             "index": int(idx),
             "Churn_Probability": float(probs[idx]),
             "Predicted_Label": 1,
             "Recommended_Action": "Offer retention benefits",
-            "Top_Reasons": "; ".join([f"{r['feature']} (+{r['shap_value']:.3f}) — {get_base_feature_name(r['feature'])}: {describe_reason(get_base_feature_name(r['feature']), r['shap_value'])}" for r in reasons]),
+            "Top_Reasons": "; ".join([f"{r['feature']} (+{r['shap_value']:.3f}) — {get_base_feature_name(r['feature'], cat_feats)}: {describe_reason(get_base_feature_name(r['feature'], cat_feats), r['shap_value'])}" for r in reasons]),
             "Reason_Comment": reason_comment,
             "Key_Factors": key_factors
         })
@@ -321,7 +363,7 @@ def main(args):
     reasons_complete["Top_Reasons"] = reasons_complete["Top_Reasons"].fillna("")
     reasons_complete["Reason_Comment"] = reasons_complete["Reason_Comment"].fillna("")
     reasons_complete["Key_Factors"] = reasons_complete["Key_Factors"].fillna("")
-    reasons_complete.to_csv(reasons_csv, index=False)
+    reasons_out = write_table(reasons_complete, reasons_csv, csv=args.csv)
 
     # Create merged predictions file with reasons
     merged = data.copy()
@@ -337,14 +379,15 @@ def main(args):
     if "Key_Factors" in merged.columns:
         merged["Key_Factors"] = merged["Key_Factors"].fillna("")
     merged_csv = os.path.join(exp_dir, "predictions_with_reasons.csv")
-    merged.to_csv(merged_csv, index=False)
+    # the React UI (UI/src/components/PredictView.js) fetches this one as CSV
+    merged_out = write_table(merged, merged_csv, csv=True)
 
     # Aggregate by Income_Category for churn-only (if present)
     if "Income_Category" in data_features.columns and len(churn_indices) > 0:
         abs_shap = np.abs(shap_pos[churn_indices])
         grouped, summaries = summarize_by_income(abs_shap, feature_names, data_features.loc[churn_indices, "Income_Category"], top_n=10)
         grouped_csv = os.path.join(exp_dir, "shap_values_summary_by_income.csv")
-        grouped.to_csv(grouped_csv)
+        write_table(grouped, grouped_csv, csv=args.csv, index=True)
 
         # Plot top features per income category
         for income_cat, s in summaries.items():
@@ -359,9 +402,7 @@ def main(args):
 
     # Example waterfall plots for a few high-risk customers
     try:
-        preproc = pipeline.named_steps["preproc"]
-        X_trans = preproc.transform(data_features)
-        explainer = shap.TreeExplainer(pipeline.named_steps["clf"])
+        explainer = tree_explainer(pipeline.named_steps["clf"])
         shap_values = explainer.shap_values(X_trans)
         if isinstance(shap_values, list) and len(shap_values) == 2:
             shap_for_positive = shap_values[1]
@@ -388,7 +429,8 @@ def main(args):
 
     # Save a minimal metadata file
     meta = {
-        "model_path": os.path.abspath(args.model),
+        "model_path": os.path.abspath(bundle.model_path),
+        "model_version": bundle.version,
         "data_path": os.path.abspath(args.data),
         "num_rows": int(data_features.shape[0]),
         "num_features_transformed": int(len(feature_names)),
@@ -397,20 +439,23 @@ def main(args):
     with open(os.path.join(exp_dir, "explain_meta.json"), "w") as f:
         json.dump(meta, f, indent=2)
 
-    print(f"Saved per-customer reasons to: {reasons_csv}")
-    print(f"Saved merged predictions with reasons to: {merged_csv}")
-    if os.path.exists(os.path.join(exp_dir, "shap_values_summary_by_income.csv")):
+    print(f"Saved per-customer reasons to: {', '.join(reasons_out)}")
+    print(f"Saved merged predictions with reasons to: {', '.join(merged_out)}")
+    if "Income_Category" in data_features.columns and len(churn_indices) > 0:
         print("Saved income-segment SHAP summary and plots.")
     print("Done.")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model", type=str, default="D:\\AI Hackathon\\models\\best_model.pkl")
+    parser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY)
+    parser.add_argument("--version", type=str, default="latest", help="Registry model version")
+    parser.add_argument("--model", type=str, default=None, help="Explicit model pickle instead of the registry")
     parser.add_argument("--data", type=str, default="D:\\AI Hackathon\\data\\new_customers.csv")
     parser.add_argument("--outdir", type=str, default="outputs")
     parser.add_argument("--top_k", type=int, default=3)
     parser.add_argument("--threshold", type=float, default=0.35)
+    parser.add_argument("--csv", action="store_true", help="Also export the remaining tables as CSV")
     args = parser.parse_args()
     main(args)
 
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+forest_engine.py
+Array-backed inference for a fitted RandomForestClassifier.
+
+The forest is flattened into contiguous arrays (feature, threshold, right child,
+P(churn) per node; nodes in depth-first order so the left child is node + 1).
+Leaves point to themselves, which marks them for the traversal kernels. Thresholds
+are stored as float32 rounded down: for float32 inputs, x <= t64 holds exactly when x <= round_down32(t64), so decisions match sklearn.
+
+- compiled: a numba loop over trees x rows (numba ships with shap)
+- numpy fallback: the whole batch is pushed through every tree at once, one
+  vectorized gather + compare per tree level; rows that hit a leaf early stay there.
+
+Run as a script to check parity against the sklearn pipeline and benchmark
+single-core throughput:
+    python src/forest_engine.py --model models/best_model.pkl --data data/bank_churn_cleaned.csv
+"""
+
+import argparse
+import time
+import numpy as np
+from scipy import sparse
+
+try:
+    from numba import njit
+except ImportError:  # numpy traversal below still works, just slower
+    njit = None
+
+
+def _traverse(X, feature, threshold, right, value, roots, out):
+    # trees in the outer loop keep one tree's nodes hot in cache; per row the
+    # leaf values are still summed in tree order, exactly like sklearn.
+    # Nodes are in depth-first order, so an internal node's left child is node + 1.
+    out[:] = 0.0
+    for t in range(roots.shape[0]):
+        for i in range(X.shape[0]):
+            node = roots[t]
+            while right[node] != node:
+                if X[i, feature[node]] <= threshold[node]:
+                    node += 1
+                else:
+                    node = right[node]
+            out[i] += value[node]
+    out /= roots.shape[0]
+
+
+_traverse_compiled = njit(cache=True, nogil=True)(_traverse) if njit is not None else None
+
+
+def _dense32(X):
+    """C-contiguous float32 rows; sparse one-hot matrices (preprocess, sparse=True) are densified."""
+    if sparse.issparse(X):
+        X = X.toarray()
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+def _round_down_f32(t):
+    """Largest float32 <= t (elementwise, t float64)."""
+    t32 = t.astype(np.float32)
+    too_big = t32.astype(np.float64) > t
+    t32[too_big] = np.nextafter(t32[too_big], np.float32(-np.inf))
+    return t32
+
+
+def _preorder(tree):
+    """Node ids in depth-first preorder with the left subtree first."""
+    internal = np.flatnonzero(tree.children_left != -1)
+    if np.all(tree.children_left[internal] == internal + 1):
+        return np.arange(tree.node_count)  # depth-first builder output is already preorder
+    order, stack = [], [0]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if tree.children_left[node] != -1:
+            stack.append(tree.children_right[node])
+            stack.append(tree.children_left[node])
+    return np.asarray(order)
+
+
+class CompactForest:
+    """Flattened binary-classification forest with a predict_proba compatible with sklearn.
+
+    Per node: feature, threshold (float32, -inf on leaves so every row goes "right"),
+    right child (a leaf's right child is itself), P(churn) and cover (training weight,
+    only needed for SHAP). The left child of an internal node is always node + 1.
+    """
+
+    def __init__(self, feature, threshold, right, value, roots, depth, n_features_in, classes, cover=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.n_features_in_ = int(n_features_in)
+        self.classes_ = np.asarray(classes)
+        self.cover = cover
+        # the kernels add leaf values in float64; float16 storage is widened once here
+        self._value = value.astype(np.float32) if value.dtype == np.float16 else value
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, rights, values, covers, roots = [], [], [], [], [], []
+        offset = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            order = _preorder(tree)
+            new_id = np.empty(tree.node_count, dtype=np.int64)
+            new_id[order] = np.arange(tree.node_count)
+            is_leaf = tree.children_left[order] == -1
+            features.append(np.where(is_leaf, 0, tree.feature[order]).astype(np.int32))
+            thresholds.append(np.where(is_leaf, -np.inf, _round_down_f32(tree.threshold[order])).astype(np.float32))
+            right = np.where(is_leaf, np.arange(tree.node_count), new_id[tree.children_right[order]])
+            rights.append((right + offset).astype(np.int32))
+            v = tree.value[order, 0, :]
+            values.append(v[:, 1] / v.sum(axis=1))
+            covers.append(tree.weighted_n_node_samples[order].astype(np.float32))
+            roots.append(offset)
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            depth=max(est.tree_.max_depth for est in forest.estimators_),
+            n_features_in=forest.n_features_in_,
+            classes=forest.classes_,
+            cover=np.concatenate(covers),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        arrays = (self.feature, self.threshold, self.right, self.value, self.roots, self.cover)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def tree_bounds(self, t):
+        """[start, stop) node range of tree t."""
+        stop = self.roots[t + 1] if t + 1 < self.n_trees else self.n_nodes
+        return int(self.roots[t]), int(stop)
+
+    def subset(self, trees):
+        """New forest made of the given trees (in that order)."""
+        parts = {k: [] for k in ("feature", "threshold", "right", "value", "cover")}
+        roots, offset = [], 0
+        for t in trees:
+            start, stop = self.tree_bounds(t)
+            for k in parts:
+                a = getattr(self, k)
+                if a is not None:
+                    parts[k].append(a[start:stop])
+            parts["right"][-1] = parts["right"][-1] - start + offset
+            roots.append(offset)
+            offset += stop - start
+        cat = {k: np.concatenate(v) if v else None for k, v in parts.items()}
+        return CompactForest(roots=np.asarray(roots, dtype=self.roots.dtype), depth=self.depth,
+                             n_features_in=self.n_features_in_, classes=self.classes_, **cat)
+
+    def tree_values(self, X):
+        """Leaf P(churn) of every tree, shape (n_rows, n_trees)."""
+        X = _dense32(X)
+        return self._value[self._leaves(X)]
+
+    def _leaves(self, X):
+        """Leaf node id reached in every tree, shape (n_rows, n_trees)."""
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).copy()
+        for _ in range(self.depth):
+            x = np.take_along_axis(X, self.feature[node], axis=1)
+            node = np.where(x <= self.threshold[node], node + 1, self.right[node])
+        return node
+
+    def predict_proba(self, X, batch_size=4096):
+        # sklearn compares float32 inputs against float64 thresholds; do the same for parity
+        X = _dense32(X)
+        p1 = np.empty(X.shape[0], dtype=np.float64)
+        if _traverse_compiled is not None:
+            _traverse_compiled(X, self.feature, self.threshold, self.right, self._value, self.roots, p1)
+        else:
+            for start in range(0, X.shape[0], batch_size):
+                chunk = X[start:start + batch_size]
+                p1[start:start + batch_size] = self._value[self._leaves(chunk)].mean(axis=1)
+        return np.column_stack([1.0 - p1, p1])
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+    def fit(self, X, y=None):
+        # only here so the forest can sit at the end of a Pipeline; it is built by from_sklearn
+        raise NotImplementedError("CompactForest is exported from a fitted forest, use from_sklearn()")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_value"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._value = self.value.astype(np.float32) if self.value.dtype == np.float16 else self.value
+
+    def to_shap_dict(self):
+        """Model dict for shap.TreeExplainer (explains the forest's mean P(churn))."""
+        if self.cover is None:
+            raise ValueError("SHAP needs node cover; re-export the forest with from_sklearn()")
+        trees = []
+        for t in range(self.n_trees):
+            start, stop = self.tree_bounds(t)
+            idx = np.arange(stop - start)
+            leaf = self.right[start:stop] - start == idx
+            left = np.where(leaf, -1, idx + 1)
+            trees.append({
+                "children_left": left,
+                "children_right": np.where(leaf, -1, self.right[start:stop] - start),
+                "children_default": left,
+                "features": np.where(leaf, -2, self.feature[start:stop]),
+                "thresholds": np.where(leaf, -2.0, self.threshold[start:stop]).astype(np.float64),
+                "values": self._value[start:stop, None].astype(np.float64) / self.n_trees,
+                "node_sample_weight": self.cover[start:stop].astype(np.float64),
+            })
+        # sklearn forests are explained on float32 inputs, which is also what the thresholds assume
+        return {"trees": trees, "input_dtype": np.float32, "internal_dtype": np.float64, "base_offset": 0.0}
+
+    def save(self, path):
+        arrays = dict(feature=self.feature, threshold=self.threshold, right=self.right, value=self.value,
+                      roots=self.roots, depth=self.depth, n_features_in=self.n_features_in_, classes=self.classes_)
+        if self.cover is not None:
+            arrays["cover"] = self.cover
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(**{k: z[k] for k in z.files})
+
+
+def benchmark(fn, X, repeat=5):
+    """Best-of-repeat rows per second for fn(X)."""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(X)
+        best = min(best, time.perf_counter() - t0)
+    return X.shape[0] / best
+
+
+def main(args):
+    import joblib
+    import pandas as pd
+    from threadpoolctl import threadpool_limits
+
+    pipeline = joblib.load(args.model)
+    df = pd.read_csv(args.data).drop(columns=["Attrition_Flag", "CLIENTNUM"], errors="ignore")
+    if args.rows:
+        df = df.head(args.rows)
+    X = pipeline.named_steps["preproc"].transform(df)
+    forest = pipeline.named_steps["clf"]
+    forest.set_params(n_jobs=1)
+    compact = CompactForest.from_sklearn(forest)
+
+    expected = pipeline.predict_proba(df)[:, 1]
+    got = compact.predict_proba(X)[:, 1]
+    max_diff = float(np.max(np.abs(expected - got)))
+    print(f"Forest: {compact.n_trees} trees, {compact.n_nodes} nodes, depth {compact.depth}")
+    print(f"Parity vs pipeline.predict_proba: max |diff| = {max_diff:.2e} over {len(df)} rows")
+
+    # throughput per core: one thread for both engines, preprocessing excluded
+    print(f"{'batch':>8} {'sklearn rows/s/core':>20} {'CompactForest':>15} {'speedup':>8}")
+    with threadpool_limits(1):
+        for batch in (1, 100, len(X)):
+            sk_rps = benchmark(forest.predict_proba, X[:batch])
+            cf_rps = benchmark(compact.predict_proba, X[:batch])
+            print(f"{batch:>8} {sk_rps:>20,.0f} {cf_rps:>15,.0f} {cf_rps / sk_rps:>7.1f}x")
+    if max_diff > args.tol:
+        raise SystemExit(f"Parity check failed: {max_diff:.2e} > {args.tol:.0e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="models/best_model.pkl")
+    parser.add_argument("--data", type=str, default="data/bank_churn_cleaned.csv")
+    parser.add_argument("--rows", type=int, default=None, help="Only use the first N rows")
+    parser.add_argument("--tol", type=float, default=1e-9, help="Max allowed |P(churn)| difference")
+    args = parser.parse_args()
+    main(args)
@@ -1,27 +1,48 @@
-import pandas as pd
-import joblib
+import argparse
 
-# Load model
-pipeline = joblib.load("D:\\AI Hackathon\\models\\best_model.pkl")
+from preprocess import read_churn_csv
+from registry import Bundle, DEFAULT_REGISTRY, get_model
 
-# Load new customers dataset
-new_customers = pd.read_csv("D:\\AI Hackathon\\data\\new_customers.csv")
 
-# Predict churn probabilities
-probs = pipeline.predict_proba(new_customers)[:, 1]
+def main(args):
+    # Load model: a registry version (default: latest) or an explicit pickle with --model
+    bundle = Bundle.from_model_path(args.model) if args.model else get_model(args.version, args.registry)
+    # the distilled student (distill.py) is stored with its teacher and shares its preprocessing
+    try:
+        clf = bundle.load_student() if args.student else bundle.model.named_steps["clf"]
+    except FileNotFoundError as e:
+        raise SystemExit(str(e))
 
-# ---- Custom Threshold ----
-threshold = 0.35   # lower than default 0.5
-y_pred = (probs >= threshold).astype(int)
+    # Load new customers dataset
+    new_customers = read_churn_csv(args.data)
 
-# Add results to DataFrame
-new_customers["Churn_Probability"] = probs.round(3)
-new_customers["Predicted_Label"] = y_pred
-new_customers["Recommended_Action"] = new_customers["Predicted_Label"].map({
-    1: "Offer retention benefits",
-    0: "No action needed"
-})
+    # Predict churn probabilities
+    probs = clf.predict_proba(bundle.transform(new_customers))[:, 1]
 
-# Save output
-new_customers.to_csv("predictions_with_actions.csv", index=False)
-print("✅ Predictions saved to predictions_with_actions.csv")
+    # ---- Custom Threshold ----
+    y_pred = (probs >= args.threshold).astype(int)
+
+    # Add results to DataFrame
+    new_customers["Churn_Probability"] = probs.round(3)
+    new_customers["Predicted_Label"] = y_pred
+    new_customers["Recommended_Action"] = new_customers["Predicted_Label"].map({
+        1: "Offer retention benefits",
+        0: "No action needed"
+    })
+
+    # Save output
+    new_customers.to_csv(args.out, index=False)
+    print(f"✅ Predictions saved to {args.out} (model {bundle.version}{', student' if args.student else ''})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY)
+    parser.add_argument("--version", type=str, default="latest", help="Registry model version")
+    parser.add_argument("--model", type=str, default=None, help="Explicit model pickle instead of the registry")
+    parser.add_argument("--data", type=str, default="D:\\AI Hackathon\\data\\new_customers.csv")
+    parser.add_argument("--out", type=str, default="predictions_with_actions.csv")
+    parser.add_argument("--threshold", type=float, default=0.35, help="Lower than the default 0.5")
+    parser.add_argument("--student", action="store_true", help="Score with the distilled student model")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,621 @@
+"""
+preprocess.py
+Feature preprocessing shared by the training scripts.
+
+- onehot:  median-impute + standard-scale numerics, one-hot categoricals (RandomForest + SMOTE)
+- ordinal: median-impute numerics, categoricals as integer codes (trees that split on categories natively,
+           or a RandomForest with SMOTENC; scale=True standardises the numerics for its distances)
+
+With sparse=True the onehot output is a SciPy CSR matrix: each row stores its
+numerics plus one entry per categorical instead of every one-hot column.
+SMOTE, RandomForest and the fold cache take CSR as is. use_sparse() picks it
+once the one-hot block reaches SPARSE_MIN_LEVELS columns (branch / product /
+region codes with hundreds of levels); save_matrix() writes CSR as .npz.
+
+read_churn_csv() loads the BankChurners columns with a fixed dtype plan (CHURN_SCHEMA:
+int8 / int16 counts, float64 ratios and dollar amounts, categorical strings) instead of type inference and
+validates them with vectorized range / level checks; the typed frame is cached as Parquet next
+to the CSV (columnar.py), so later reads skip parsing and validation.
+
+FusedPreprocessor is the fitted ColumnTransformer reduced to its parameters (medians,
+means, scales, category tables) and applied as plain NumPy, with the same output
+as preproc.transform but without the pandas / ColumnTransformer dispatch.
+"""
+
+import argparse
+import os
+import time
+import json
+import warnings
+import zlib
+import numpy as np
+import pandas as pd
+
+from scipy import sparse as sp
+from packaging import version
+from sklearn import __version__ as sklearn_version
+
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder, StandardScaler
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+
+from columnar import read_cached, read_table, write_table
+
+
+# one-hot columns from which use_sparse() switches to CSR
+SPARSE_MIN_LEVELS = 100
+
+TARGET = "Attrition_Flag"
+
+# column -> (dtype, min, max) for numerics, (category levels) for strings; None = unbounded.
+# The 3-decimal ratios stay float64: rounded to float32, values such as 0.1 or 0.7 land
+# on the other side of the same literal cut points in the dashboards and rules. Dollar
+# amounts stay float64 too, so the dashboard aggregates match a plain read_csv.
+CHURN_SCHEMA = {
+    "CLIENTNUM": ("int32", 0, None),
+    "Attrition_Flag": ("Existing Customer", "Attrited Customer"),
+    "Customer_Age": ("int8", 0, 120),
+    "Gender": ("F", "M"),
+    "Dependent_count": ("int8", 0, 20),
+    "Education_Level": ("Uneducated", "High School", "College", "Graduate", "Post-Graduate", "Doctorate", "Unknown"),
+    "Marital_Status": ("Single", "Married", "Divorced", "Unknown"),
+    "Income_Category": ("Less than $40K", "$40K - $60K", "$60K - $80K", "$80K - $120K", "$120K +", "Unknown"),
+    "Card_Category": ("Blue", "Silver", "Gold", "Platinum"),
+    "Months_on_book": ("int16", 0, 1200),
+    "Total_Relationship_Count": ("int8", 0, 100),
+    "Months_Inactive_12_mon": ("int8", 0, 12),
+    "Contacts_Count_12_mon": ("int8", 0, 100),
+    "Credit_Limit": ("float64", 0, None),
+    "Total_Revolving_Bal": ("int16", 0, None),
+    "Avg_Open_To_Buy": ("float64", None, None),
+    "Total_Amt_Chng_Q4_Q1": ("float64", 0, None),
+    "Total_Trans_Amt": ("int16", 0, None),
+    "Total_Trans_Ct": ("int16", 0, None),
+    "Total_Ct_Chng_Q4_Q1": ("float64", 0, None),
+    "Avg_Utilization_Ratio": ("float64", 0, 1),
+}
+NUMERIC_SCHEMA = {c: spec for c, spec in CHURN_SCHEMA.items() if spec[0] in ("int8", "int16", "int32", "float32", "float64")}
+CATEGORICAL_SCHEMA = {c: spec for c, spec in CHURN_SCHEMA.items() if c not in NUMERIC_SCHEMA}
+
+
+def read_dtypes():
+    """dtype= for pd.read_csv. Integers are parsed as float64 and narrowed in apply_schema:
+    pandas wraps out-of-range values silently when parsing straight into int8 / int16,
+    and cannot hold missing values in them."""
+    dtypes = {c: "category" for c in CATEGORICAL_SCHEMA}
+    for c, (dtype, _, _) in NUMERIC_SCHEMA.items():
+        dtypes[c] = "float64" if dtype.startswith("int") else dtype
+    return dtypes
+
+
+def validate_frame(df):
+    """Vectorized schema checks on the schema columns present in df.
+
+    Returns hard problems (values outside a numeric column's range, unknown target
+    labels) as strings; unknown levels of feature columns only warn, since the
+    encoders map unseen categories to no column / code -1.
+    """
+    problems = []
+    num = [c for c in NUMERIC_SCHEMA if c in df.columns]
+    if num:
+        values = df[num].to_numpy(dtype=np.float64)
+        lo = np.array([-np.inf if NUMERIC_SCHEMA[c][1] is None else NUMERIC_SCHEMA[c][1] for c in num])
+        hi = np.array([np.inf if NUMERIC_SCHEMA[c][2] is None else NUMERIC_SCHEMA[c][2] for c in num])
+        with np.errstate(invalid="ignore"):
+            bad = (values < lo) | (values > hi) | np.isinf(values)
+        for j in np.flatnonzero(bad.any(axis=0)):
+            rows = np.flatnonzero(bad[:, j])
+            problems.append(f"{num[j]}: {len(rows)} value(s) outside [{lo[j]:g}, {hi[j]:g}], "
+                            f"e.g. {values[rows[0], j]:g} in row {rows[0]}")
+    for col, levels in CATEGORICAL_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        unknown = df[col].notna() & ~df[col].isin(levels)
+        n_unknown = int(unknown.sum())
+        if n_unknown:
+            message = f"{col}: {n_unknown} value(s) outside {list(levels)}, e.g. {df[col][unknown].iloc[0]!r}"
+            if col == TARGET:
+                problems.append(message)
+            else:
+                warnings.warn(message)
+    return problems
+
+
+def apply_schema(df, validate=True):
+    """Validate, then narrow integer columns to their planned dtype (float32 when they have missing values)."""
+    if validate:
+        problems = validate_frame(df)
+        if problems:
+            raise ValueError("Schema check failed: " + "; ".join(problems))
+    for col, (dtype, _, _) in NUMERIC_SCHEMA.items():
+        if col not in df.columns or not dtype.startswith("int"):
+            continue
+        s = df[col]
+        info = np.iinfo(dtype)
+        if s.isna().any():
+            df[col] = s.astype(np.float32)
+        elif s.min() >= info.min and s.max() <= info.max:
+            df[col] = s.astype(dtype)
+        else:  # not validated or beyond the plan (e.g. balances above int16): smallest integer that fits
+            df[col] = pd.to_numeric(s.astype(np.int64), downcast="integer")
+    return df
+
+
+def read_churn_csv(path, validate=True, chunksize=None, **kwargs):
+    """pd.read_csv with the CHURN_SCHEMA dtype plan (columns outside the schema are inferred).
+
+    With chunksize, yields one typed, validated chunk at a time. Validated reads go through the
+    columnar cache (a Parquet copy of the typed frame, see columnar.py), keyed by the schema too.
+    """
+    def parse(path, usecols=None, chunksize=None):
+        reader = pd.read_csv(path, dtype=read_dtypes(), usecols=usecols, chunksize=chunksize, **kwargs)
+        if chunksize is None:
+            return apply_schema(reader, validate)
+        return (apply_schema(chunk, validate) for chunk in reader)
+
+    usecols = kwargs.pop("usecols", None)
+    if not validate or kwargs:
+        return parse(path, usecols, chunksize)
+    tag = f"schema-{zlib.crc32(repr(CHURN_SCHEMA).encode()):08x}"
+    return read_cached(path, parse, tag, usecols=usecols, chunksize=chunksize)
+
+
+def to_float64(X):
+    """Numeric block as float64, so narrow (int8 / float32) input is imputed and scaled like the fused path."""
+    return np.asarray(X, dtype=np.float64)
+
+
+def make_onehot(sparse=False):
+    # choose OneHotEncoder param depending on sklearn version
+    if version.parse(sklearn_version) >= version.parse("1.2"):
+        return OneHotEncoder(handle_unknown="ignore", sparse_output=sparse)
+    return OneHotEncoder(handle_unknown="ignore", sparse=sparse)
+
+
+def onehot_levels(X, categorical_feats):
+    """Number of one-hot columns the categoricals of X expand to (missing values impute to a seen level)."""
+    return int(sum(X[c].nunique() for c in categorical_feats))
+
+
+def use_sparse(X, categorical_feats, mode="auto", min_levels=SPARSE_MIN_LEVELS):
+    """mode "on" / "off", or "auto": CSR once the one-hot block has at least min_levels columns."""
+    if mode == "auto":
+        return onehot_levels(X, categorical_feats) >= min_levels
+    return mode == "on"
+
+
+def build_preprocessor(numeric_feats, categorical_feats, encoding="onehot", sparse=False, scale=None):
+    """ColumnTransformer with numeric columns first, then categoricals.
+
+    sparse=True (onehot only) makes transform return CSR. scale defaults to
+    encoding == "onehot"; ordinal + scale is for samplers that measure distances (SMOTENC).
+    """
+    if scale is None:
+        scale = encoding == "onehot"
+    # schema-typed frames hold int8 / float32 numerics; compute in float64 whatever the input
+    numeric_steps = [
+        ("float64", FunctionTransformer(to_float64, feature_names_out="one-to-one")),
+        ("imputer", SimpleImputer(strategy="median")),
+    ]
+    if scale:
+        numeric_steps.append(("scaler", StandardScaler()))
+    numeric_transformer = Pipeline(numeric_steps)
+    if encoding == "ordinal":
+        # unseen categories map to -1, which HistGradientBoosting treats as missing
+        categorical_transformer = Pipeline([
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            ("ordinal", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1))
+        ])
+    elif encoding == "onehot":
+        categorical_transformer = Pipeline([
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            ("onehot", make_onehot(sparse))
+        ])
+    else:
+        raise ValueError(f"Unknown encoding: {encoding!r}")
+
+    # sparse_threshold=1: keep the stacked output CSR whatever its density
+    return ColumnTransformer([
+        ("num", numeric_transformer, numeric_feats),
+        ("cat", categorical_transformer, categorical_feats)
+    ], remainder="drop", sparse_threshold=1.0 if sparse and encoding == "onehot" else 0.0)
+
+
+def categorical_mask(numeric_feats, categorical_feats):
+    """Boolean mask over the build_preprocessor output columns (ordinal encoding)."""
+    return np.array([False] * len(numeric_feats) + [True] * len(categorical_feats))
+
+
+def categorical_indices(numeric_feats, categorical_feats):
+    """Output column indices of the ordinal codes, as a list (the form SMOTENC accepts)."""
+    return list(range(len(numeric_feats), len(numeric_feats) + len(categorical_feats)))
+
+
+class FusedPreprocessor:
+    """Parameters of a fitted build_preprocessor() ColumnTransformer, applied in one NumPy pass.
+
+    Categories are kept sorted (as the sklearn encoders store them) so a column is
+    encoded with a single searchsorted; values not seen in training get no one-hot
+    column (onehot) or code -1 (ordinal), like the sklearn encoders. Unscaled
+    numerics have means 0 and scales 1.
+    """
+
+    def __init__(self, encoding, numeric_feats, categorical_feats, medians, means, scales,
+                 fill_values, categories, cat_offsets, feature_names):
+        self.encoding = str(encoding)
+        self.numeric_feats = [str(c) for c in numeric_feats]
+        self.categorical_feats = [str(c) for c in categorical_feats]
+        self.medians = np.asarray(medians, dtype=np.float64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.fill_values = np.asarray(fill_values, dtype=str)
+        self.categories = np.asarray(categories, dtype=str)
+        self.cat_offsets = np.asarray(cat_offsets, dtype=np.int64)
+        self.feature_names = [str(c) for c in feature_names]
+
+    @classmethod
+    def from_column_transformer(cls, preproc):
+        if isinstance(preproc, FusedPreprocessor):  # pipelines trained out of core (train.py --chunksize)
+            return preproc
+        num = preproc.named_transformers_["num"]
+        cat = preproc.named_transformers_["cat"]
+        numeric_feats, categorical_feats = [], []
+        for name, _, cols in preproc.transformers_:
+            if name == "num":
+                numeric_feats = list(cols)
+            elif name == "cat":
+                categorical_feats = list(cols)
+
+        encoding = "ordinal" if "ordinal" in cat.named_steps else "onehot"
+        if isinstance(num, SimpleImputer):  # unscaled, from before the float64 step
+            imputer, scaler = num, None
+        else:
+            imputer, scaler = num.named_steps["imputer"], num.named_steps.get("scaler")
+        encoder = cat.named_steps[encoding]
+        medians = imputer.statistics_.astype(np.float64)
+        means = scaler.mean_ if scaler is not None else np.zeros(len(numeric_feats))
+        scales = scaler.scale_ if scaler is not None else np.ones(len(numeric_feats))
+
+        cat_lists = [np.asarray(c, dtype=str) for c in encoder.categories_]
+        cat_offsets = np.cumsum([0] + [len(c) for c in cat_lists])
+        return cls(
+            encoding=encoding,
+            numeric_feats=numeric_feats,
+            categorical_feats=categorical_feats,
+            medians=medians,
+            means=means,
+            scales=scales,
+            fill_values=cat.named_steps["imputer"].statistics_.astype(str),
+            categories=np.concatenate(cat_lists) if cat_lists else np.array([], dtype=str),
+            cat_offsets=cat_offsets,
+            feature_names=preproc.get_feature_names_out(),
+        )
+
+    @property
+    def n_features_out(self):
+        return len(self.feature_names)
+
+    def fit(self, X, y=None):
+        # parameters come from a fitted ColumnTransformer or streaming statistics;
+        # fit only exists so this can sit in a Pipeline as the "preproc" step
+        return self
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray(self.feature_names, dtype=object)
+
+    def category_table(self):
+        """Ordinal code -> category for every categorical column (explanations, outputs/ordinal_mapping.parquet)."""
+        rows = []
+        for j, col in enumerate(self.categorical_feats):
+            cats = self.categories[self.cat_offsets[j]:self.cat_offsets[j + 1]]
+            rows += [(col, code, cat) for code, cat in enumerate(cats)]
+        return pd.DataFrame(rows, columns=["feature", "code", "category"])
+
+    def decode(self, j, codes):
+        """Categories of categorical column j for ordinal codes (-1 -> "unseen")."""
+        cats = self.categories[self.cat_offsets[j]:self.cat_offsets[j + 1]]
+        codes = np.asarray(codes, dtype=np.int64)
+        return np.where(codes >= 0, cats[np.clip(codes, 0, max(len(cats) - 1, 0))], "unseen")
+
+    def _codes(self, values, j):
+        """Category index per row for categorical column j (-1 when unseen)."""
+        values = np.asarray(values, dtype=object)
+        missing = pd.isna(values)
+        if missing.any():
+            values = np.where(missing, self.fill_values[j], values)
+        values = values.astype(str)
+        cats = self.categories[self.cat_offsets[j]:self.cat_offsets[j + 1]]
+        idx = np.searchsorted(cats, values)
+        idx_clipped = np.minimum(idx, len(cats) - 1)
+        return np.where(cats[idx_clipped] == values, idx_clipped, -1)
+
+    def transform(self, X, out=None):
+        """X: DataFrame or any mapping column -> values. Returns float64 (n_rows, n_features_out).
+
+        Pass a preallocated `out` to skip the allocation on hot paths.
+        """
+        n_num = len(self.numeric_feats)
+        n_rows = len(X[self.numeric_feats[0]] if n_num else X[self.categorical_feats[0]])
+        if out is None:
+            out = np.empty((n_rows, self.n_features_out), dtype=np.float64)
+
+        # 1) numerics: impute + scale, written straight into the output block
+        for j, col in enumerate(self.numeric_feats):
+            out[:, j] = np.asarray(X[col], dtype=np.float64)
+        block = out[:, :n_num]
+        missing = np.isnan(block)
+        if missing.any():
+            block[missing] = np.broadcast_to(self.medians, block.shape)[missing]
+        block -= self.means
+        block /= self.scales
+
+        # 2) categoricals: codes (ordinal) or one-hot columns at the same offsets sklearn uses
+        if self.encoding == "ordinal":
+            for j, col in enumerate(self.categorical_feats):
+                out[:, n_num + j] = self._codes(X[col], j)
+        else:
+            out[:, n_num:] = 0.0
+            rows = np.arange(n_rows)
+            for j, col in enumerate(self.categorical_feats):
+                codes = self._codes(X[col], j)
+                known = codes >= 0
+                out[rows[known], n_num + self.cat_offsets[j] + codes[known]] = 1.0
+        return out
+
+    def save(self, path):
+        np.savez(path, encoding=self.encoding, numeric_feats=np.asarray(self.numeric_feats, dtype=str),
+                 categorical_feats=np.asarray(self.categorical_feats, dtype=str), medians=self.medians,
+                 means=self.means, scales=self.scales, fill_values=self.fill_values,
+                 categories=self.categories, cat_offsets=self.cat_offsets,
+                 feature_names=np.asarray(self.feature_names, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(**{k: z[k] for k in z.files})
+
+
+def as_float32(X):
+    """float32 copy of a transformed matrix, keeping CSR sparse (trees fit in float32 either way)."""
+    if sp.issparse(X):
+        return sp.csr_matrix(X, dtype=np.float32)
+    return np.asarray(X, dtype=np.float32)
+
+
+def save_matrix(path, X, feature_names, csv=False):
+    """Write a transformed matrix: CSR -> <path>.npz (CSR arrays + feature names), dense -> <path>.parquet
+    (plus <path>.csv with csv=True).
+
+    Returns the files written.
+    """
+    if sp.issparse(X):
+        X = X.tocsr()
+        out = path + ".npz"
+        np.savez_compressed(out, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+                            feature_names=np.asarray(feature_names, dtype=str))
+        return [out]
+    return write_table(pd.DataFrame(X, columns=feature_names), path + ".csv", csv=csv)
+
+
+def load_matrix(path):
+    """(matrix, feature names) from save_matrix output."""
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as z:
+            X = sp.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+            return X, z["feature_names"].tolist()
+    df = read_table(path)
+    return df.to_numpy(), df.columns.tolist()
+
+
+def fused_path(model_path):
+    """models/best_model.pkl -> models/best_model_preproc.npz"""
+    return os.path.splitext(model_path)[0] + "_preproc.npz"
+
+
+def load_fused(model_path):
+    """The FusedPreprocessor exported next to a model pickle, or None if there is none."""
+    path = fused_path(model_path)
+    return FusedPreprocessor.load(path) if os.path.exists(path) else None
+
+
+def _benchmark_data(path, levels):
+    """Cleaned data as (X, y); levels > 0 adds synthetic branch (levels) and product (levels // 4) codes."""
+    df = pd.read_csv(path).drop(columns=["CLIENTNUM"], errors="ignore")
+    y = df.pop("Attrition_Flag").map({"Existing Customer": 0, "Attrited Customer": 1}).values
+    if levels:
+        rng = np.random.RandomState(0)
+        df["Branch_Code"] = np.char.add("B", rng.randint(levels, size=len(df)).astype(str))
+        df["Product_Code"] = np.char.add("P", rng.randint(max(1, levels // 4), size=len(df)).astype(str))
+    return df, y
+
+
+def benchmark_sparse(args):
+    """Dense vs CSR one-hot through preprocessing, SMOTE and a RandomForest fit.
+
+    The cleaned data gets two synthetic high-cardinality codes (a branch with --levels
+    levels, default 500, and a product with --levels // 4) so the one-hot block is realistically wide.
+    """
+    import tracemalloc
+    from imblearn.over_sampling import SMOTE
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    levels = 500 if args.levels is None else args.levels
+    df, y = _benchmark_data(args.data, levels)
+    numeric = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical = df.select_dtypes(include=["object", "category"]).columns.tolist()
+    X_train, X_test, y_train, y_test = train_test_split(df, y, test_size=0.2, stratify=y, random_state=0)
+    print(f"{len(X_train)} training rows, {onehot_levels(X_train, categorical)} one-hot columns "
+          f"(use_sparse auto -> {use_sparse(X_train, categorical)})")
+
+    results = {}
+    for name, sparse in (("dense", False), ("sparse", True)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        preproc = build_preprocessor(numeric, categorical, "onehot", sparse=sparse)
+        Xt = as_float32(preproc.fit_transform(X_train))
+        t1 = time.perf_counter()
+        Xs, ys = SMOTE(random_state=0).fit_resample(Xt, y_train)
+        t2 = time.perf_counter()
+        clf = RandomForestClassifier(n_estimators=args.n_estimators, class_weight="balanced",
+                                     random_state=0, n_jobs=1).fit(Xs, ys)
+        t3 = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        auc = roc_auc_score(y_test, clf.predict_proba(preproc.transform(X_test))[:, 1])
+        nbytes = Xs.data.nbytes + Xs.indices.nbytes + Xs.indptr.nbytes if sp.issparse(Xs) else Xs.nbytes
+        results[name] = {"matrix_mb": nbytes / 1e6, "peak_traced_mb": peak / 1e6, "preproc_seconds": t1 - t0,
+                         "smote_seconds": t2 - t1, "fit_seconds": t3 - t2, "roc_auc": auc}
+
+    print(f"{'path':<7} {'matrix MB':>10} {'peak MB':>8} {'preproc s':>10} {'smote s':>8} {'fit s':>7} {'ROC AUC':>8}")
+    for name, r in results.items():
+        print(f"{name:<7} {r['matrix_mb']:>10.1f} {r['peak_traced_mb']:>8.1f} {r['preproc_seconds']:>10.2f} "
+              f"{r['smote_seconds']:>8.2f} {r['fit_seconds']:>7.2f} {r['roc_auc']:>8.4f}")
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w") as f:
+            json.dump({"levels": levels, "n_estimators": args.n_estimators, "results": results}, f, indent=2)
+
+
+def benchmark_encoding(args):
+    """One-hot (float64, SMOTE) vs ordinal codes (float32, SMOTENC) for the RandomForest.
+
+    Reports matrix size, resampling / fit time, test ROC AUC and the time to explain
+    500 test rows with SHAP (one value per transformed column).
+    """
+    import shap
+    from imblearn.over_sampling import SMOTE, SMOTENC
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    df, y = _benchmark_data(args.data, args.levels or 0)
+    numeric = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical = df.select_dtypes(include=["object", "category"]).columns.tolist()
+    X_train, X_test, y_train, y_test = train_test_split(df, y, test_size=0.2, stratify=y, random_state=0)
+
+    results = {}
+    for encoding in ("onehot", "ordinal"):
+        preproc = build_preprocessor(numeric, categorical, encoding, scale=True)
+        t0 = time.perf_counter()
+        Xt = preproc.fit_transform(X_train)
+        if encoding == "ordinal":
+            Xt = as_float32(Xt)
+            sampler = SMOTENC(categorical_features=categorical_indices(numeric, categorical), random_state=0)
+        else:
+            sampler = SMOTE(random_state=0)
+        t1 = time.perf_counter()
+        Xs, ys = sampler.fit_resample(Xt, y_train)
+        t2 = time.perf_counter()
+        clf = RandomForestClassifier(n_estimators=args.n_estimators, class_weight="balanced",
+                                     random_state=0, n_jobs=1).fit(Xs, ys)
+        t3 = time.perf_counter()
+        Xe = preproc.transform(X_test)
+        auc = roc_auc_score(y_test, clf.predict_proba(Xe)[:, 1])
+        t4 = time.perf_counter()
+        shap.TreeExplainer(clf).shap_values(Xe[:500], check_additivity=False)
+        results[encoding] = {"columns": int(Xt.shape[1]), "dtype": str(Xt.dtype), "matrix_mb": Xs.nbytes / 1e6,
+                             "preproc_seconds": t1 - t0, "resample_seconds": t2 - t1, "fit_seconds": t3 - t2,
+                             "roc_auc": auc, "shap_seconds": time.perf_counter() - t4}
+
+    print(f"{'encoding':<8} {'columns':>8} {'dtype':>8} {'matrix MB':>10} {'resample s':>11} {'fit s':>7} "
+          f"{'ROC AUC':>8} {'SHAP s':>7}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['columns']:>8} {r['dtype']:>8} {r['matrix_mb']:>10.2f} {r['resample_seconds']:>11.2f} "
+              f"{r['fit_seconds']:>7.2f} {r['roc_auc']:>8.4f} {r['shap_seconds']:>7.2f}")
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w") as f:
+            json.dump({"levels": args.levels or 0, "n_estimators": args.n_estimators, "results": results}, f, indent=2)
+
+
+def benchmark_schema(args):
+    """Plain pd.read_csv vs read_churn_csv (uncached, from the Parquet cache, and 5 projected
+    columns from the cache): read time, in-memory size and dtypes."""
+    def uncached(path):
+        os.environ["CHURN_CSV_CACHE"] = "0"
+        try:
+            return read_churn_csv(path)
+        finally:
+            del os.environ["CHURN_CSV_CACHE"]
+
+    columns = [c for c in NUMERIC_SCHEMA if c in read_churn_csv(args.data).columns][:5]  # also builds the cache
+    loaders = (("read_csv", pd.read_csv), ("schema", uncached), ("cached", read_churn_csv),
+               ("cached_5", lambda path: read_churn_csv(path, usecols=columns)))
+    results = {}
+    for name, read in loaders:
+        best = np.inf
+        for _ in range(max(1, args.repeat // 4)):
+            t0 = time.perf_counter()
+            df = read(args.data)
+            best = min(best, time.perf_counter() - t0)
+        results[name] = {"seconds": best, "memory_mb": df.memory_usage(deep=True).sum() / 1e6,
+                         "dtypes": df.dtypes.astype(str).value_counts().to_dict()}
+
+    print(f"{'loader':<9} {'read ms':>9} {'memory MB':>10}  dtypes")
+    for name, r in results.items():
+        dtypes = ", ".join(f"{k} x{v}" for k, v in sorted(r["dtypes"].items()))
+        print(f"{name:<9} {r['seconds'] * 1000:>9.1f} {r['memory_mb']:>10.2f}  {dtypes}")
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w") as f:
+            json.dump({"data": args.data, "results": results}, f, indent=2)
+
+
+def main(args):
+    import joblib
+
+    if args.sparse_benchmark:
+        return benchmark_sparse(args)
+    if args.encoding_benchmark:
+        return benchmark_encoding(args)
+    if args.schema_benchmark:
+        return benchmark_schema(args)
+    preproc = joblib.load(args.model).named_steps["preproc"]
+    fused = FusedPreprocessor.from_column_transformer(preproc)
+    df = read_churn_csv(args.data).drop(columns=["Attrition_Flag", "CLIENTNUM"], errors="ignore")
+
+    expected = preproc.transform(df)
+    if sp.issparse(expected):
+        expected = expected.toarray()
+    max_diff = float(np.max(np.abs(fused.transform(df) - expected)))
+    print(f"Parity vs preproc.transform: max |diff| = {max_diff:.2e} over {len(df)} rows")
+    print(f"{'batch':>8} {'preproc ms':>11} {'fused ms':>9} {'speedup':>8}")
+    for batch in (1, 100, len(df)):
+        X = df.head(batch)
+        times = []
+        for fn in (preproc.transform, fused.transform):
+            best = np.inf
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                fn(X)
+                best = min(best, time.perf_counter() - t0)
+            times.append(best * 1000)
+        print(f"{batch:>8} {times[0]:>11.3f} {times[1]:>9.3f} {times[0] / times[1]:>7.1f}x")
+    if max_diff > 0:
+        raise SystemExit("Parity check failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the fused transform against preproc.transform")
+    parser.add_argument("--model", type=str, default="models/best_model.pkl")
+    parser.add_argument("--data", type=str, default="data/bank_churn_cleaned.csv")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sparse_benchmark", action="store_true",
+                        help="Instead: compare dense vs sparse one-hot memory and fit time")
+    parser.add_argument("--encoding_benchmark", action="store_true",
+                        help="Instead: compare one-hot vs ordinal matrix size, fit time, AUC and SHAP time")
+    parser.add_argument("--schema_benchmark", action="store_true",
+                        help="Instead: compare plain read_csv vs the schema dtype plan and its Parquet cache (read time, memory)")
+    parser.add_argument("--levels", type=int, default=None,
+                        help="Synthetic branch code levels (default 500 for --sparse_benchmark, none otherwise)")
+    parser.add_argument("--n_estimators", type=int, default=100, help="Forest size (benchmarks)")
+    parser.add_argument("--report", type=str, default=None,
+                        help="JSON output (default outputs/<sparse|encoding|schema>_benchmark.json)")
+    args = parser.parse_args()
+    if args.report is None:
+        kind = "sparse" if args.sparse_benchmark else "schema" if args.schema_benchmark else "encoding"
+        args.report = f"outputs/{kind}_benchmark.json"
+    main(args)
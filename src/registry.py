@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+registry.py
+Local registry of versioned model bundles.
+
+    models/registry/
+        LATEST                      -> "v0003"
+        v0001/ v0002/ v0003/
+            model.pkl               fitted pipeline
+            model_serving.joblib    memory-mappable array-backed forest (rf, see serving.py)
+            model_preproc.npz       fused preprocessing (preprocess.FusedPreprocessor)
+            model_student.pkl       distilled student of this model (distill.py attaches it)
+            feature_names.json
+            metrics.json            full training metrics (train.py)
+            ordinal_mapping.parquet code -> category (ordinal encoding)
+            outputs/                every file the training run wrote to its outdir (plots, tables,
+                                    transformed matrices), restored on a training cache hit
+            manifest.json           version, created_at, data / training fingerprints, engine, params, metrics
+
+A bundle is assembled in a hidden temp directory and renamed into place, and LATEST
+is replaced with os.replace, so readers only ever see complete bundles. Numbering the
+new version, the rename and the LATEST update run under a file lock (models/registry/
+.publish.lock), so concurrent training processes never pick the same version or leave
+LATEST on the older one.
+
+get_model(version="latest") loads a bundle once per process and caches it. For
+"latest" the pointer is checked on every call (one stat, re-read when it changed), so a
+long-running service picks up a newly published version on its next call,
+without a restart. The cache keeps the most recently used bundles only (2 by default),
+so superseded versions are dropped once the service has moved on; callers holding the
+previous bundle keep using it untouched.
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from preprocess import load_fused
+from serving import load_serving
+from student import student_path
+
+DEFAULT_REGISTRY = os.path.join("models", "registry")
+MODEL_FILE = "model.pkl"
+# artifacts next to a model pickle that belong to that model: <stem><suffix> <-> bundle model<suffix>
+SIBLINGS = ("_serving.joblib", "_preproc.npz", "_student.pkl")
+
+
+class LRUCache:
+    """Thread-safe key -> value map holding the maxsize most recently used entries."""
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """The value for key, built with create(key) on a miss; evicts the least recently used."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            value = self._items[key] = create(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+            return value
+
+    def __len__(self):
+        return len(self._items)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on path across processes; the OS releases it if the holder dies."""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class Bundle:
+    """One model version: pipeline (memory-mapped where possible), fused preprocessing, metadata."""
+
+    def __init__(self, path):
+        self.path = path
+        self.model_path = os.path.join(path, MODEL_FILE)
+        manifest = os.path.join(path, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                self.manifest = json.load(f)
+        self.version = self.manifest.get("version", os.path.basename(os.path.normpath(path)))
+        self.model = load_serving(self.model_path)
+        self.fused = load_fused(self.model_path)
+        names = os.path.join(path, "feature_names.json")
+        if os.path.exists(names):
+            with open(names) as f:
+                self.feature_names = json.load(f)
+        else:
+            self.feature_names = self.fused.feature_names if self.fused is not None else None
+
+    @classmethod
+    def from_model_path(cls, model_path):
+        """Bundle view of loose artifacts (e.g. models/best_model.pkl + its siblings)."""
+        bundle = cls.__new__(cls)
+        bundle.path = os.path.dirname(model_path)
+        bundle.model_path = model_path
+        bundle.manifest = {}
+        bundle.version = os.path.basename(model_path)
+        bundle.model = load_serving(model_path)
+        bundle.fused = load_fused(model_path)
+        bundle.feature_names = bundle.fused.feature_names if bundle.fused is not None else None
+        return bundle
+
+    def transform(self, X):
+        """Model-ready features for raw rows (fused kernel when exported)."""
+        if self.fused is not None:
+            return self.fused.transform(X)
+        return self.model.named_steps["preproc"].transform(X)
+
+    def predict_proba(self, X):
+        return self.model.named_steps["clf"].predict_proba(self.transform(X))
+
+    def load_student(self):
+        """Classifier of the student distilled from this model; it takes the same transformed features."""
+        path = student_path(self.model_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model {self.version} has no distilled student ({path}); "
+                                    "run distill.py on this model first")
+        return load_serving(path).named_steps["clf"]
+
+
+class ModelRegistry:
+    def __init__(self, root=DEFAULT_REGISTRY, max_cached=2):
+        self.root = root
+        self._cache = LRUCache(max_cached)
+        self._lock = threading.Lock()
+        self._latest = (None, None)  # ((inode, mtime, size) of LATEST, version it names)
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root)
+                      if d.startswith("v") and os.path.isdir(os.path.join(self.root, d)))
+
+    def latest(self):
+        """Version LATEST points at (falls back to the highest version)."""
+        try:
+            with open(os.path.join(self.root, "LATEST")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            versions = self.versions()
+            if not versions:
+                raise FileNotFoundError(f"No model versions in {self.root}")
+            return versions[-1]
+
+    def resolve(self, version="latest"):
+        """Version name for version; "latest" costs one stat of LATEST while the pointer is unchanged
+        (os.replace in set_latest gives it a new inode)."""
+        if version != "latest":
+            return version
+        try:
+            st = os.stat(os.path.join(self.root, "LATEST"))
+        except FileNotFoundError:
+            return self.latest()
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        cached_key, resolved = self._latest
+        if cached_key != key:
+            resolved = self.latest()
+            self._latest = (key, resolved)
+        return resolved
+
+    def model_path(self, version="latest"):
+        """Path of a version's model.pkl, without loading the bundle."""
+        return os.path.join(self.root, self.resolve(version), MODEL_FILE)
+
+    def set_latest(self, version):
+        """Atomically point LATEST at version (publishing or rolling back)."""
+        if not os.path.isdir(os.path.join(self.root, version)):
+            raise FileNotFoundError(f"Unknown model version {version!r} in {self.root}")
+        tmp = os.path.join(self.root, f".LATEST.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(self.root, "LATEST"))
+
+    def publish(self, model_path, metrics=None, data_fingerprint=None, feature_names=None, extra=None,
+                files=None, make_latest=True):
+        """Copy a trained model, its sibling artifacts and files ({bundle name: path}) into a new version.
+
+        Returns the new version.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        stem = os.path.splitext(model_path)[0]
+        tmp = os.path.join(self.root, f".publish.{os.getpid()}.{threading.get_ident()}.tmp")
+        os.makedirs(tmp)
+        shutil.copy2(model_path, os.path.join(tmp, MODEL_FILE))
+        for suffix in SIBLINGS:
+            if os.path.exists(stem + suffix):
+                shutil.copy2(stem + suffix, os.path.join(tmp, "model" + suffix))
+        for name, src in (files or {}).items():
+            os.makedirs(os.path.dirname(os.path.join(tmp, name)), exist_ok=True)
+            shutil.copy2(src, os.path.join(tmp, name))
+        if feature_names is not None:
+            with open(os.path.join(tmp, "feature_names.json"), "w") as f:
+                json.dump([str(n) for n in feature_names], f, indent=2)
+
+        # the number is only taken under the lock, shared with other training processes
+        with self._lock, file_lock(os.path.join(self.root, ".publish.lock")):
+            existing = [int(v[1:]) for v in self.versions() if v[1:].isdigit()]
+            version = f"v{(max(existing) + 1 if existing else 1):04d}"
+            manifest = {
+                "version": version,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "source": os.path.abspath(model_path),
+                "data_fingerprint": data_fingerprint,
+                "metrics": metrics or {},
+                **(extra or {}),
+            }
+            with open(os.path.join(tmp, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2, default=str)
+            os.rename(tmp, os.path.join(self.root, version))
+            if make_latest:
+                self.set_latest(version)
+        return version
+
+    def find(self, key, value):
+        """Newest version whose manifest has manifest[key] == value, else None."""
+        for version in reversed(self.versions()):
+            try:
+                with open(os.path.join(self.root, version, "manifest.json")) as f:
+                    if json.load(f).get(key) == value:
+                        return version
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def find_model(self, model_path):
+        """Newest version whose model.pkl is byte-identical to model_path (publish copies it), else None."""
+        for version in reversed(self.versions()):
+            path = os.path.join(self.root, version, MODEL_FILE)
+            if os.path.exists(path) and filecmp.cmp(path, model_path, shallow=False):
+                return version
+        return None
+
+    def attach(self, version, files):
+        """Add files ({bundle name: path}) to an existing version, each replaced atomically."""
+        dst = os.path.join(self.root, version)
+        if not os.path.isdir(dst):
+            raise FileNotFoundError(f"Unknown model version {version!r} in {self.root}")
+        for name, src in files.items():
+            tmp = os.path.join(dst, f".{name}.{os.getpid()}.tmp")
+            shutil.copy2(src, tmp)
+            os.replace(tmp, os.path.join(dst, name))
+
+    def restore(self, version, model_path):
+        """Copy a bundle's model artifacts back to model_path and its siblings (inverse of publish)."""
+        src = os.path.join(self.root, version)
+        stem = os.path.splitext(model_path)[0]
+        for suffix in SIBLINGS:  # siblings of whatever model was there before
+            if os.path.exists(stem + suffix):
+                os.remove(stem + suffix)
+        for name in os.listdir(src):
+            if name == MODEL_FILE:
+                shutil.copy2(os.path.join(src, name), model_path)
+            elif name.startswith("model_"):
+                shutil.copy2(os.path.join(src, name), stem + name[len("model"):])
+
+    def get(self, version="latest"):
+        """The (cached) Bundle for version; "latest" follows the LATEST pointer on every call.
+
+        Only the max_cached most recently used versions stay loaded.
+        """
+        return self._cache.get(self.resolve(version), lambda v: Bundle(os.path.join(self.root, v)))
+
+
+_registries = {}
+
+
+def get_registry(root=DEFAULT_REGISTRY):
+    registry = _registries.get(root)
+    if registry is None:
+        registry = _registries.setdefault(root, ModelRegistry(root))
+    return registry
+
+
+def get_model(version="latest", registry=DEFAULT_REGISTRY):
+    """Bundle for a model version, loaded lazily and cached in-process."""
+    return get_registry(registry).get(version)
+
+
+def get_model_path(version="latest", registry=DEFAULT_REGISTRY):
+    """model.pkl of a model version, resolved without building its Bundle."""
+    return get_registry(registry).model_path(version)
+
+
+def main(args):
+    registry = get_registry(args.registry)
+    if args.set_latest:
+        registry.set_latest(args.set_latest)
+        print(f"LATEST -> {args.set_latest}")
+    versions = registry.versions()
+    if not versions:
+        print(f"No model versions in {args.registry}")
+        return
+    latest = registry.latest()
+    for v in versions:
+        with open(os.path.join(args.registry, v, "manifest.json")) as f:
+            m = json.load(f)
+        auc = m.get("metrics", {}).get("roc_auc")
+        auc = f"{auc:.4f}" if auc is not None else "-"
+        print(f"{'*' if v == latest else ' '} {v}  {m.get('created_at', '')}  roc_auc={auc}  "
+              f"data={str(m.get('data_fingerprint'))[:12]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List model versions or switch LATEST")
+    parser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY)
+    parser.add_argument("--set_latest", type=str, default=None, help="Point LATEST at this version (rollback)")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,93 @@
+"""
+scheduler.py
+Memory-aware parallelism plan for hyperparameter search.
+
+Each concurrent fit holds its own (SMOTE-inflated) fold plus the trees it grows, and
+every thread of the forest (RandomForest n_jobs) its own tree-building buffers.
+Given a memory budget, the plan caps the number of concurrent fits and hands the
+remaining cores to the forest itself, as long as the extra threads' buffers still
+fit, so search-level and forest-level parallelism never oversubscribe the machine.
+"""
+
+import re
+import numpy as np
+from joblib import cpu_count, effective_n_jobs
+
+# sklearn Tree node struct (~64 bytes) + value array for 2 classes (16 bytes)
+NODE_BYTES = 80
+# per-row working memory while a tree is built (sample indices, weights, sort buffers)
+ROW_WORK_BYTES = 32
+
+_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2,
+          "G": 1024 ** 3, "GB": 1024 ** 3, "T": 1024 ** 4, "TB": 1024 ** 4}
+
+
+def parse_bytes(text) -> int:
+    """'512MB' / '4 GB' / '1073741824' -> bytes."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", str(text).upper())
+    if not m:
+        raise ValueError(f"Cannot parse memory size: {text!r}")
+    return int(float(m.group(1)) * _UNITS[m.group(2)])
+
+
+def format_bytes(n) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def estimate_fit_bytes(n_rows, n_features, params, engine="rf", shared_data=False, n_threads=1):
+    """Rough peak memory of one candidate fit.
+
+    n_rows is the row count the model is trained on (after SMOTE for rf). With
+    shared_data (memory-mapped fold cache) the fold itself is not counted per fit.
+    A forest fitted with n_threads builds that many trees at once, each with its own
+    working memory.
+    """
+    data = 0 if shared_data else n_rows * n_features * (8 + 4)  # float64 fold + float32 copy for the trees
+    if engine == "hgb":
+        n_iter = params.get("clf__max_iter", 100)
+        leaves = params.get("clf__max_leaf_nodes", 31)
+        binned = n_rows * n_features  # uint8 bins
+        return int(data + binned + n_rows * ROW_WORK_BYTES + n_iter * 2 * leaves * NODE_BYTES)
+
+    n_estimators = params.get("clf__n_estimators", 100)
+    max_depth = params.get("clf__max_depth")
+    min_leaf = params.get("clf__min_samples_leaf", 1)
+    # bootstrap sees ~63% distinct rows; depth caps the leaf count at 2**depth
+    leaves = 0.632 * n_rows / min_leaf
+    if max_depth is not None:
+        leaves = min(leaves, 2 ** max_depth)
+    trees = n_estimators * 2 * leaves * NODE_BYTES
+    return int(data + trees + n_threads * n_rows * ROW_WORK_BYTES)
+
+
+def worst_case_params(param_dist):
+    """The most memory-hungry corner of a list-valued search space."""
+    worst = {}
+    for name, values in param_dist.items():
+        if name.endswith("max_depth"):
+            worst[name] = None if None in values else max(values)
+        elif name.endswith("min_samples_leaf"):
+            worst[name] = min(values)
+        elif all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            worst[name] = max(values)
+    return worst
+
+
+def plan_parallelism(fit_bytes, mem_budget, n_jobs=-1):
+    """(concurrent fits, threads per fit) within mem_budget and the available cores.
+
+    fit_bytes(n_threads=k) is the peak memory of one fit using n_threads. n_jobs follows
+    joblib: -1 all cores, -2 all but one, None one (outside a parallel_backend context).
+    """
+    cores = min(effective_n_jobs(n_jobs), cpu_count())
+    by_memory = max(1, int(mem_budget // max(fit_bytes(n_threads=1), 1)))
+    outer = int(np.clip(by_memory, 1, cores))
+    inner = max(1, cores // outer)
+    # spare cores go to the forest only while every fit's extra thread buffers fit too
+    while inner > 1 and outer * fit_bytes(n_threads=inner) > mem_budget:
+        inner -= 1
+    return outer, inner
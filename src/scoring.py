@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+scoring.py
+Single-customer scoring without pandas.
+
+score_one(record) validates the raw fields of bank_churn_cleaned.csv (everything
+except Attrition_Flag) straight into a preallocated NumPy row, using the fused
+preprocessing parameters, and runs the model on it: the memory-mapped array-backed
+forest when train.py exported one (serving.py), otherwise the pipeline's classifier.
+
+Run as a script for a parity check against pipeline.predict_proba and a p50/p99
+latency micro-benchmark:
+    python src/scoring.py --model models/best_model.pkl --data data/bank_churn_cleaned.csv
+"""
+
+import argparse
+import math
+import time
+import numpy as np
+import joblib
+
+from forest_engine import CompactForest
+from preprocess import FusedPreprocessor, load_fused
+from registry import DEFAULT_REGISTRY, LRUCache, get_model_path
+from serving import load_serving
+
+
+class Scorer:
+    def __init__(self, model_path):
+        pipeline = load_serving(model_path)
+        self.clf = pipeline.named_steps["clf"]
+        self.fused = load_fused(model_path) or FusedPreprocessor.from_column_transformer(pipeline.named_steps["preproc"])
+        self.forest = self.clf if isinstance(self.clf, CompactForest) else None
+
+        f = self.fused
+        self.fields = f.numeric_feats + f.categorical_feats
+        self.n_num = len(f.numeric_feats)
+        # category -> output column (onehot) or code (ordinal), one dict lookup per field
+        self.lookup = []
+        for j in range(len(f.categorical_feats)):
+            cats = f.categories[f.cat_offsets[j]:f.cat_offsets[j + 1]]
+            base = self.n_num + f.cat_offsets[j] if f.encoding == "onehot" else 0
+            self.lookup.append({c: base + i for i, c in enumerate(cats)})
+        self.row = np.zeros((1, f.n_features_out), dtype=np.float64)
+        self.row32 = np.zeros((1, f.n_features_out), dtype=np.float32)
+
+    def _fill(self, record):
+        """Validate record into self.row; raises ValueError listing every bad field."""
+        f, row = self.fused, self.row
+        errors = [f"missing field {name!r}" for name in self.fields if name not in record]
+        if errors:
+            raise ValueError("; ".join(errors))
+
+        # 1) numerics: None / NaN -> training median, then standardise (identity when unscaled)
+        for j, name in enumerate(f.numeric_feats):
+            v = record[name]
+            if v is None:
+                row[0, j] = f.medians[j]
+                continue
+            if isinstance(v, bool):
+                errors.append(f"{name}: expected a number, got {v!r}")
+                continue
+            try:
+                x = float(v)
+            except (TypeError, ValueError):
+                errors.append(f"{name}: expected a number, got {v!r}")
+                continue
+            row[0, j] = f.medians[j] if math.isnan(x) else x
+        num = row[0, :self.n_num]
+        num -= f.means
+        num /= f.scales
+
+        # 2) categoricals: None / NaN -> training mode; unseen -> no column / code -1
+        if f.encoding == "onehot":
+            row[0, self.n_num:] = 0.0
+        for j, name in enumerate(f.categorical_feats):
+            v = record[name]
+            if v is None or (isinstance(v, float) and math.isnan(v)):
+                v = f.fill_values[j]
+            elif not isinstance(v, str):
+                errors.append(f"{name}: expected a string, got {v!r}")
+                continue
+            col = self.lookup[j].get(v, -1)
+            if f.encoding == "ordinal":
+                row[0, self.n_num + j] = col
+            elif col >= 0:
+                row[0, col] = 1.0
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    def score_one(self, record: dict) -> float:
+        """P(churn) for one customer given as {raw field: value}."""
+        self._fill(record)
+        if self.forest is not None:
+            self.row32[:] = self.row
+            return float(self.forest.predict_proba(self.row32)[0, 1])
+        return float(self.clf.predict_proba(self.row)[0, 1])
+
+
+# the current model and the one it replaced; older ones are freed once LATEST moves on
+_scorers = LRUCache(maxsize=2)
+
+
+def score_one(record: dict, version="latest", registry=DEFAULT_REGISTRY) -> float:
+    """P(churn) for one customer with a registry model version.
+
+    One Scorer per model path (the two most recently used are kept); "latest" is resolved with a stat of the LATEST pointer
+    (no Bundle is built), so a newly published model is picked up on the next call.
+    """
+    return _scorers.get(get_model_path(version, registry), Scorer).score_one(record)
+
+
+def latency_us(fn, records):
+    """Per-call latency in microseconds for fn(record) over records."""
+    out = np.empty(len(records))
+    for i, r in enumerate(records):
+        t0 = time.perf_counter_ns()
+        fn(r)
+        out[i] = (time.perf_counter_ns() - t0) / 1000
+    return out
+
+
+def main(args):
+    import pandas as pd
+
+    pipeline = joblib.load(args.model)
+    df = pd.read_csv(args.data).drop(columns=["Attrition_Flag", "CLIENTNUM"], errors="ignore")
+    df = df.sample(n=min(args.n, len(df)), random_state=0)
+    records = df.to_dict("records")
+    scorer = Scorer(args.model)
+    clf = pipeline.named_steps["clf"]
+    if hasattr(clf, "n_jobs"):
+        clf.n_jobs = 1  # per-record latency, not thread fan-out
+
+    # parity against the full pipeline
+    expected = pipeline.predict_proba(df)[:, 1]
+    got = np.array([scorer.score_one(r) for r in records])
+    max_diff = float(np.max(np.abs(expected - got)))
+    print(f"Model: {args.model} ({'array-backed forest' if scorer.forest is not None else type(scorer.clf).__name__})")
+    print(f"Parity vs pipeline.predict_proba: max |diff| = {max_diff:.2e} over {len(records)} records")
+
+    baseline = latency_us(lambda r: pipeline.predict_proba(pd.DataFrame([r]))[:, 1], records[:args.n_baseline])
+    fast = latency_us(scorer.score_one, records)
+    print(f"{'path':<34} {'p50 us':>9} {'p99 us':>9}")
+    print(f"{'pipeline.predict_proba(DataFrame)':<34} {np.percentile(baseline, 50):>9.1f} {np.percentile(baseline, 99):>9.1f}")
+    print(f"{'score_one(dict)':<34} {np.percentile(fast, 50):>9.1f} {np.percentile(fast, 99):>9.1f}")
+    if max_diff > args.tol:
+        raise SystemExit(f"Parity check failed: {max_diff:.2e} > {args.tol:.0e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="models/best_model.pkl")
+    parser.add_argument("--data", type=str, default="data/bank_churn_cleaned.csv")
+    parser.add_argument("--n", type=int, default=2000, help="Records to score with score_one")
+    parser.add_argument("--n_baseline", type=int, default=200, help="Records to score through the pipeline")
+    parser.add_argument("--tol", type=float, default=1e-9, help="Max allowed |P(churn)| difference")
+    args = parser.parse_args()
+    main(args)
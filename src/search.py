@@ -0,0 +1,426 @@
+"""
+search.py
+Hyperparameter search over cached CV folds.
+
+Only the `clf__*` parameters vary between candidates, so the ColumnTransformer and
+SMOTE are fitted once per fold and the resulting arrays are stored as .npy files.
+Every candidate then reads the same memory-mapped fold instead of recomputing it.
+On top of the cache: warm-started growth, out-of-bag selection, racing and TPE search.
+"""
+
+import os
+import json
+import time
+import pickle
+import numpy as np
+from scipy import sparse
+from functools import partial
+from statistics import NormalDist
+from joblib import Parallel, delayed
+
+from sklearn.base import clone
+
+from evaluation import roc_auc
+from preprocess import as_float32
+from tpe import TPESampler
+from trials import params_key
+
+
+def strip_prefix(params, prefix="clf__"):
+    """{'clf__max_depth': 6} -> {'max_depth': 6}"""
+    return {k[len(prefix):] if k.startswith(prefix) else k: v for k, v in params.items()}
+
+
+class FoldCache:
+    """Transformed (+ resampled, if a sampler is given) CV folds persisted as .npy files and memory-mapped on read.
+
+    Layout of cache_dir:
+        manifest.json                 data fingerprint + fold count
+        fold_<i>_<X|y>_<train|val>.npy
+        fold_<i>_X_<train|val>.npz    instead of .npy for sparse one-hot folds (loaded, not mapped)
+    """
+
+    def __init__(self, cache_dir, preprocessor, sampler, cv):
+        self.cache_dir = cache_dir
+        self.preprocessor = preprocessor
+        self.sampler = sampler
+        self.cv = cv
+        self.n_splits = cv.get_n_splits()
+
+    def _path(self, i, name):
+        return os.path.join(self.cache_dir, f"fold_{i}_{name}.npy")
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, "manifest.json")
+
+    def is_valid(self, fingerprint):
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return manifest.get("fingerprint") == fingerprint and manifest.get("n_splits") == self.n_splits
+
+    def build(self, X, y, fingerprint=None):
+        """Fit preprocessing + resampling once per fold; reuse files when the fingerprint matches."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if fingerprint is not None and self.is_valid(fingerprint):
+            print(f"Reusing fold cache in {self.cache_dir}")
+            return self
+
+        # invalidate first: an interrupted rebuild must not leave the old manifest vouching
+        # for a mix of old and new folds
+        if os.path.exists(self._manifest_path()):
+            os.remove(self._manifest_path())
+        y = np.asarray(y)
+        for i, (tr, va) in enumerate(self.cv.split(X, y)):
+            preproc = clone(self.preprocessor)
+            X_tr = preproc.fit_transform(X.iloc[tr], y[tr])
+            X_va = preproc.transform(X.iloc[va])
+            y_tr = y[tr]
+            if self.sampler is not None:
+                X_tr, y_tr = clone(self.sampler).fit_resample(X_tr, y_tr)
+            # trees work in float32 internally; storing float32 avoids a per-fit copy
+            self._save_X(i, "X_train", as_float32(X_tr))
+            np.save(self._path(i, "y_train"), np.asarray(y_tr))
+            self._save_X(i, "X_val", as_float32(X_va))
+            np.save(self._path(i, "y_val"), y[va])
+            print(f"Cached fold {i}: train {X_tr.shape}, val {X_va.shape}")
+
+        tmp = f"{self._manifest_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fingerprint": fingerprint, "n_splits": self.n_splits}, f, indent=2)
+        os.replace(tmp, self._manifest_path())  # written only once every fold is complete
+        return self
+
+    def _save_X(self, i, name, X):
+        dense, csr = self._path(i, name), self._path(i, name)[:-len(".npy")] + ".npz"
+        for stale in (dense, csr):  # a previous build may have used the other layout
+            if os.path.exists(stale):
+                os.remove(stale)
+        if sparse.issparse(X):
+            sparse.save_npz(csr, X, compressed=False)
+        else:
+            np.save(dense, X)
+
+    def _load(self, i, name):
+        csr = self._path(i, name)[:-len(".npy")] + ".npz"
+        if os.path.exists(csr):
+            return sparse.load_npz(csr)
+        return np.load(self._path(i, name), mmap_mode="r")
+
+    def fold(self, i):
+        """(X_train, y_train, X_val, y_val) for fold i, memory-mapped read-only (dense)."""
+        return tuple(self._load(i, name) for name in ("X_train", "y_train", "X_val", "y_val"))
+
+
+def _group_key(params, grow_param):
+    """Everything except the size parameter: candidates sharing a key can share one growing model."""
+    return tuple(sorted((k, repr(v)) for k, v in params.items() if k != grow_param))
+
+
+def grow_on_fold(fold_cache, clf, grow_param, params, steps, i):
+    """Fit one model on fold i and score it after each size in steps.
+
+    With warm_start the forest keeps its existing trees and only adds the missing
+    ones; sklearn reseeds the added trees exactly as a fresh fit would, so the
+    score after n trees equals that of an n-tree forest trained from scratch.
+    The same holds for boosting iterations (clf__max_iter).
+    """
+    X_tr, y_tr, X_va, y_va = fold_cache.fold(i)
+    model = clone(clf).set_params(**strip_prefix(params))
+    model.set_params(warm_start=True)
+    trials = {}
+    for n in sorted(steps):
+        model.set_params(**strip_prefix({grow_param: n}))
+        model.fit(X_tr, y_tr)
+        trials[n] = _trial(model, X_va, y_va)
+    return trials
+
+
+def _trial(model, X_eval, y_eval, scores=None):
+    """ROC AUC of a fitted model on (X_eval, y_eval), or of the given scores (OOB)."""
+    if scores is None:
+        scores = model.predict_proba(X_eval)[:, 1]
+    return {"score": float(roc_auc(y_eval, scores))}
+
+
+def _record(params, fold_trials):
+    """Search record from the per-fold trial dicts of one candidate (None = fold not scored)."""
+    done = [t for t in fold_trials if t is not None]
+    return {
+        "params": params,
+        "fold_scores": [None if t is None else t["score"] for t in fold_trials],
+        "mean_test_score": float(np.mean([t["score"] for t in done])),
+    }
+
+
+def group_candidates(candidates, warm_start=False, grow_grid=None, grow_param="clf__n_estimators"):
+    """Map candidates to (base params, size steps) groups.
+
+    Without warm_start every candidate is its own group. With warm_start, candidates
+    that differ only in grow_param share a group; if grow_grid is given, every grid
+    value up to the group's largest model is scored too, since those intermediate
+    models are built anyway.
+    """
+    groups = {}
+    for idx, params in enumerate(candidates):
+        key = _group_key(params, grow_param) if warm_start else idx
+        base = {k: v for k, v in params.items() if k != grow_param}
+        groups.setdefault(key, {"params": base, "steps": set()})
+        groups[key]["steps"].add(params[grow_param])
+    if warm_start and grow_grid:
+        for g in groups.values():
+            g["steps"].update(n for n in grow_grid if n <= max(g["steps"]))
+    return list(groups.values())
+
+
+def run_trials(run, tasks, grow_param, store=None, fingerprint=None, n_jobs=1, verbose=0):
+    """Run run(params, steps, fold) -> {size: trial} for each (params, steps, fold) task.
+
+    Trials already in the store are not refitted; new ones are written to it as soon
+    as they come back from the workers, so an interrupted search loses nothing.
+    """
+    results = []
+    pending = []
+    for t, (params, steps, fold) in enumerate(tasks):
+        found = {}
+        if store is not None:
+            for n in steps:
+                trial = store.get(fingerprint, {**params, grow_param: n}, fold)
+                if trial is not None:
+                    found[n] = trial
+        results.append(found)
+        missing = set(steps) - set(found)
+        if missing:
+            pending.append((t, missing))
+    if store is not None:
+        n_trials = sum(len(steps) for _, steps, _ in tasks)
+        print(f"Trial store: reusing {n_trials - sum(len(m) for _, m in pending)} of {n_trials} trials")
+
+    outputs = Parallel(n_jobs=n_jobs, verbose=verbose, return_as="generator")(
+        delayed(run)(tasks[t][0], missing, tasks[t][2]) for t, missing in pending
+    )
+    for (t, _), step_trials in zip(pending, outputs):
+        params, _, fold = tasks[t]
+        results[t].update(step_trials)
+        if store is not None:
+            for n, trial in step_trials.items():
+                store.put(fingerprint, {**params, grow_param: n}, fold, trial)
+    return results
+
+
+def evaluate_candidates(fold_cache, clf, candidates, n_jobs=1, verbose=0, warm_start=False, grow_grid=None,
+                        grow_param="clf__n_estimators", store=None, fingerprint=None):
+    """Score candidates on every cached fold.
+
+    Returns one record per (params, size): params, per-fold ROC AUC and the mean.
+    """
+    groups = group_candidates(candidates, warm_start, grow_grid, grow_param)
+    tasks = [(g, i) for g in range(len(groups)) for i in range(fold_cache.n_splits)]
+    trials = run_trials(
+        partial(grow_on_fold, fold_cache, clf, grow_param),
+        [(groups[g]["params"], groups[g]["steps"], i) for g, i in tasks],
+        grow_param, store, fingerprint, n_jobs, verbose
+    )
+    fold_trials = {}
+    for (g, i), step_trials in zip(tasks, trials):
+        for n, t in step_trials.items():
+            fold_trials.setdefault((g, n), [None] * fold_cache.n_splits)[i] = t
+    return [_record({**groups[g]["params"], grow_param: n}, ft) for (g, n), ft in sorted(fold_trials.items())]
+
+
+def bayes_search(fold_cache, clf, param_dist, n_iter, n_startup=5, random_state=None, n_jobs=1, verbose=0,
+                 warm_start=False, grow_grid=None, grow_param="clf__n_estimators", store=None, fingerprint=None):
+    """Sequential model-based search: each candidate is proposed by a TPE fitted on all finished ones.
+
+    The first n_startup candidates are random. Returns (records, stats) where stats
+    holds the best mean ROC AUC after every proposal.
+    """
+    sampler = TPESampler(param_dist, n_startup=n_startup, random_state=random_state)
+    results = {}
+    best_by_iter = []
+    for it in range(n_iter):
+        params = sampler.suggest([(r["params"], r["mean_test_score"]) for r in results.values()])
+        if params is None:
+            break
+        for r in evaluate_candidates(fold_cache, clf, [params], n_jobs, verbose, warm_start, grow_grid,
+                                     grow_param, store, fingerprint):
+            results[params_key(r["params"])] = r
+        best_by_iter.append(max(r["mean_test_score"] for r in results.values()))
+        print(f"Bayes iter {it}: {params} -> best mean AUC so far {best_by_iter[-1]:.4f}")
+    return list(results.values()), {"n_startup": n_startup, "best_score_by_iter": best_by_iter}
+
+
+def _paired_lower_bound(diffs, z):
+    """Normal-approximation lower confidence bound on the mean of per-fold score differences.
+
+    Every candidate is scored on the same folds, so pairing the scores cancels the
+    fold-to-fold variance (some folds are simply harder) that swamps unpaired intervals.
+    """
+    mean = float(np.mean(diffs))
+    half = z * float(np.std(diffs, ddof=1)) / np.sqrt(len(diffs)) if len(diffs) > 1 else np.inf
+    return mean - half
+
+
+def race_candidates(fold_cache, clf, candidates, confidence=0.95, min_folds=2, n_jobs=1, verbose=0,
+                    warm_start=False, grow_grid=None, grow_param="clf__n_estimators", store=None, fingerprint=None):
+    """Evaluate candidates fold by fold and drop the ones that are clearly losing.
+
+    After min_folds folds, each candidate is compared with the leader on their per-fold
+    ROC AUC differences: one whose lower confidence bound on the leader's mean margin is
+    above zero is not scored on the remaining folds.
+    Returns (records, stats); dropped records keep the fold scores they did get.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    groups = group_candidates(candidates, warm_start, grow_grid, grow_param)
+    fold_trials = {(g, n): [None] * fold_cache.n_splits for g, grp in enumerate(groups) for n in grp["steps"]}
+    fold_scores = {c: [None] * fold_cache.n_splits for c in fold_trials}
+    alive = set(fold_trials)
+    dropped_after = {}
+
+    for i in range(fold_cache.n_splits):
+        todo = {}
+        for g, n in alive:
+            todo.setdefault(g, set()).add(n)
+        trials = run_trials(
+            partial(grow_on_fold, fold_cache, clf, grow_param),
+            [(groups[g]["params"], steps, i) for g, steps in todo.items()],
+            grow_param, store, fingerprint, n_jobs, verbose
+        )
+        for g, step_trials in zip(todo, trials):
+            for n, t in step_trials.items():
+                fold_trials[(g, n)][i] = t
+                fold_scores[(g, n)][i] = t["score"]
+
+        if i + 1 < min_folds or i + 1 == fold_cache.n_splits:
+            continue
+        leader = max(alive, key=lambda c: np.mean(fold_scores[c][:i + 1]))
+        lead = np.asarray(fold_scores[leader][:i + 1])
+        for c in list(alive - {leader}):
+            if _paired_lower_bound(lead - np.asarray(fold_scores[c][:i + 1]), z) > 0:
+                alive.discard(c)
+                dropped_after[c] = i
+        print(f"Racing fold {i}: {len(alive)} candidates left, leader AUC {np.mean(fold_scores[leader][:i + 1]):.4f}")
+
+    results = []
+    for (g, n), ft in sorted(fold_trials.items()):
+        record = _record({**groups[g]["params"], grow_param: n}, ft)
+        record["n_folds_scored"] = sum(t is not None for t in ft)
+        record["dropped"] = (g, n) in dropped_after
+        record["dropped_after_fold"] = dropped_after.get((g, n))
+        results.append(record)
+    n_total = len(fold_trials) * fold_cache.n_splits
+    n_run = sum(r["n_folds_scored"] for r in results)
+    stats = {"fits_run": n_run, "fits_skipped": n_total - n_run, "candidates_dropped": len(dropped_after)}
+    return results, stats
+
+
+def _grow_oob(X, y, n_original, clf, grow_param, params, steps, fold=-1):
+    model = clone(clf).set_params(**strip_prefix(params))
+    model.set_params(warm_start=True, oob_score=True, bootstrap=True)
+    trials = {}
+    for n in sorted(steps):
+        model.set_params(**strip_prefix({grow_param: n}))
+        model.fit(X, y)
+        # score real customers only: SMOTE appends its synthetic rows after the originals
+        oob = model.oob_decision_function_[:n_original, 1]
+        seen = ~np.isnan(oob)
+        trials[n] = _trial(model, None, y[:n_original][seen], scores=oob[seen])
+    return trials
+
+
+def evaluate_candidates_oob(preprocessor, sampler, clf, X, y, candidates, n_jobs=1, verbose=0,
+                            warm_start=False, grow_grid=None, grow_param="clf__n_estimators",
+                            store=None, fingerprint=None):
+    """Score candidates on out-of-bag predictions from one fit on the whole training split.
+
+    Preprocessing and SMOTE run once. The forest is fitted on originals + synthetic rows,
+    but only the original rows are scored. Synthetic rows interpolated from a customer
+    can still be in-bag for trees where that customer is out-of-bag, so OOB AUC reads
+    slightly optimistic next to CV; use it to rank candidates, not to report performance.
+    """
+    X_t = as_float32(preprocessor.fit_transform(X, y))
+    y = np.asarray(y)
+    n_original = len(y)
+    if sampler is not None:
+        X_t, y = clone(sampler).fit_resample(X_t, y)
+        X_t = as_float32(X_t)
+
+    groups = group_candidates(candidates, warm_start, grow_grid, grow_param)
+    # OOB trials are stored under fold -1
+    trials = run_trials(
+        partial(_grow_oob, X_t, y, n_original, clf, grow_param),
+        [(g["params"], g["steps"], -1) for g in groups],
+        grow_param, store, fingerprint, n_jobs, verbose
+    )
+    results = []
+    for g, step_trials in zip(groups, trials):
+        for n, t in sorted(step_trials.items()):
+            record = _record({**g["params"], grow_param: n}, [t])
+            record["oob_roc_auc"] = t["score"]
+            del record["fold_scores"]
+            results.append(record)
+    return results
+
+
+def serving_cost(model, X, n_rows=1000, repeat=5):
+    """Serving cost of a served artifact: ms to score 1000 rows and pickled size in MB.
+
+    Timed on up to n_rows of X after a warm-up call (first-call allocations, kernel
+    compilation), best of repeat.
+    """
+    X = X[:n_rows]
+    model.predict_proba(X[:10])
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.predict_proba(X)
+        best = min(best, time.perf_counter() - t0)
+    return {"latency_ms": best * 1000 * 1000 / X.shape[0],
+            "model_mb": len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 2 ** 20}
+
+
+def within_budget(record, max_latency_ms=None, max_model_mb=None):
+    return ((max_latency_ms is None or record["latency_ms"] <= max_latency_ms)
+            and (max_model_mb is None or record["model_mb"] <= max_model_mb))
+
+
+def select_candidate(results, fit, X, max_latency_ms=None, max_model_mb=None, serve=None, verbose=0):
+    """(record, fitted model) of the highest-scoring finalist within the serving budget.
+
+    Search trials only score. Here every finalist (candidate not dropped by racing) is
+    fitted with fit(params), one at a time, and serve(model) -- the artifact actually
+    served, default the model itself -- is timed on X and pickled; the records get
+    latency_ms / model_mb for the Pareto front. Only the chosen model and the best-scoring
+    one are kept. Falls back to the best candidate overall (with a warning) if none fits.
+    """
+    ranked = sorted((r for r in results if not r.get("dropped")), key=lambda r: r["mean_test_score"], reverse=True)
+    if verbose:
+        print(f"Measuring serving cost of {len(ranked)} finalists...")
+    chosen = top = None
+    for record in ranked:
+        model = fit(record["params"])
+        record.update(serving_cost(model if serve is None else serve(model), X))
+        top = top or (record, model)
+        if chosen is None and within_budget(record, max_latency_ms, max_model_mb):
+            chosen = (record, model)
+    if chosen is None:
+        print("Warning: no candidate meets the latency/size budget; selecting on ROC AUC alone")
+        chosen = top
+    return chosen
+
+
+def pareto_front(results):
+    """Measured candidates not dominated on (higher ROC AUC, lower latency, smaller model), by descending AUC."""
+    measured = [r for r in results if "latency_ms" in r]
+
+    def dominates(a, b):
+        ge = (a["mean_test_score"] >= b["mean_test_score"] and a["latency_ms"] <= b["latency_ms"]
+              and a["model_mb"] <= b["model_mb"])
+        gt = (a["mean_test_score"] > b["mean_test_score"] or a["latency_ms"] < b["latency_ms"]
+              or a["model_mb"] < b["model_mb"])
+        return ge and gt
+
+    front = [r for r in measured if not any(dominates(o, r) for o in measured if o is not r)]
+    return sorted(front, key=lambda r: r["mean_test_score"], reverse=True)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+serving.py
+Model artifacts that many processes can share as read-only memory-mapped pages.
+
+A joblib-loaded RandomForest costs its full size in every process: sklearn's Tree
+copies its node arrays into private memory when unpickled. The serving artifact
+(models/best_model_serving.joblib) is the same pipeline with the forest swapped for
+the array-backed CompactForest, dumped uncompressed, so joblib.load(..., mmap_mode="r")
+maps the big arrays straight from the page cache and every process shares one copy.
+HistGradientBoosting keeps its trees as plain arrays already, so for --engine hgb
+best_model.pkl itself is mapped.
+
+Run as a script to compare load time and per-process memory (RSS, USS, PSS) of N
+concurrent processes loading the pickle vs the memory-mapped serving artifact (needs psutil):
+    python src/serving.py --model models/best_model.pkl --procs 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import joblib
+
+from imblearn.pipeline import Pipeline as ImbPipeline
+
+from forest_engine import CompactForest
+
+
+def serving_path(model_path):
+    """models/best_model.pkl -> models/best_model_serving.joblib"""
+    return os.path.splitext(model_path)[0] + "_serving.joblib"
+
+
+def serving_pipeline(pipeline):
+    """What is served for a fitted pipeline: its preprocessing + the array-backed forest,
+    or the pipeline itself when the model has no sklearn trees (None then)."""
+    clf = pipeline.named_steps["clf"]
+    if not hasattr(clf, "estimators_"):
+        return None
+    # same fitted preprocessing; SMOTE only acts at fit time
+    steps = [(name, step) for name, step in pipeline.steps if name not in ("smote", "clf")]
+    return ImbPipeline(steps=steps + [("clf", CompactForest.from_sklearn(clf))])
+
+
+def export_serving(pipeline, model_path):
+    """Write the mmap-friendly serving copy of a fitted pipeline; returns its path (None if not needed)."""
+    serving = serving_pipeline(pipeline)
+    path = serving_path(model_path)
+    if serving is None:
+        # no sklearn Tree objects, the pickle maps as is; drop a stale copy of an earlier model
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    joblib.dump(serving, path)  # uncompressed: compressed files cannot be memory-mapped
+    return path
+
+
+def load_serving(model_path, mmap=True):
+    """The serving artifact for model_path if one was exported, else model_path itself."""
+    path = serving_path(model_path)
+    if not os.path.exists(path):
+        path = model_path
+    return joblib.load(path, mmap_mode="r" if mmap else None)
+
+
+_CHILD = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+import numpy as np, joblib, psutil
+import sklearn.ensemble, imblearn.pipeline
+import serving, forest_engine
+# warm up libraries and the traversal kernel (read-only arrays compile separately)
+# so the numbers below are the model's alone
+ro = [np.zeros(1, dtype=d) for d in (np.int32, np.float32, np.int32, np.float64, np.int32)]
+for a in ro:
+    a.flags.writeable = False
+forest_engine._traverse_compiled(np.zeros((1, 1), np.float32), *ro, np.zeros(1))
+rss0 = psutil.Process().memory_info().rss
+t0 = time.perf_counter()
+model = {load}
+load_seconds = time.perf_counter() - t0
+clf = model.named_steps["clf"]
+clf.predict_proba(np.random.RandomState(0).randn(2000, clf.n_features_in_))  # fault in the tree pages
+print(json.dumps({{"load_seconds": load_seconds, "rss_model": psutil.Process().memory_info().rss - rss0}}), flush=True)
+sys.stdin.readline()
+"""
+
+
+def measure(load_expr, procs):
+    """Start procs concurrent loaders; per process load time and memory while all are alive."""
+    try:
+        import psutil  # benchmark only; serving itself does not need it
+    except ImportError:
+        raise ImportError("The load / memory benchmark measures processes with psutil: pip install psutil") from None
+    src = os.path.dirname(os.path.abspath(__file__))
+    code = _CHILD.format(src=src, load=load_expr)
+    children = [subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                for _ in range(procs)]
+    try:
+        rows = []
+        for p in children:
+            row = json.loads(p.stdout.readline())
+            mem = psutil.Process(p.pid).memory_full_info()
+            row.update(rss=mem.rss, uss=mem.uss, pss=getattr(mem, "pss", float("nan")))
+            rows.append(row)
+    finally:
+        for p in children:
+            p.communicate("\n")
+    return {k: float(np.mean([r[k] for r in rows])) for k in rows[0]}
+
+
+def main(args):
+    if not os.path.exists(serving_path(args.model)):
+        path = export_serving(joblib.load(args.model), args.model)
+        print(f"Exported serving artifact: {path}" if path else "Model maps as is, no serving artifact needed")
+
+    modes = {
+        "joblib.load(pickle)": f"joblib.load({args.model!r})",
+        "load_serving(mmap)": f"serving.load_serving({args.model!r})",
+    }
+    mb = 1024 ** 2
+    print(f"{args.procs} concurrent processes, averages per process")
+    print(f"{'mode':<22} {'load ms':>8} {'model RSS':>10} {'RSS MB':>8} {'USS MB':>8} {'PSS MB':>8}")
+    results = {}
+    for name, expr in modes.items():
+        r = results[name] = measure(expr, args.procs)
+        print(f"{name:<22} {r['load_seconds'] * 1000:>8.1f} {r['rss_model'] / mb:>10.1f} "
+              f"{r['rss'] / mb:>8.1f} {r['uss'] / mb:>8.1f} {r['pss'] / mb:>8.1f}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"procs": args.procs, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="models/best_model.pkl")
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--report", type=str, default=None, help="Optional JSON output")
+    args = parser.parse_args()
+    main(args)
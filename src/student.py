@@ -0,0 +1,45 @@
+"""
+student.py
+Serving-side pieces of the distilled student model (see distill.py).
+
+Kept out of distill.py so pickled students do not point at the script's __main__.
+"""
+
+import os
+import numpy as np
+
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+
+
+class DistilledClassifier(BaseEstimator, ClassifierMixin):
+    """Classifier face for a regressor fitted on teacher probabilities."""
+
+    def __init__(self, regressor=None, classes=(0, 1)):
+        self.regressor = regressor
+        self.classes = classes
+
+    def fit(self, X, p):
+        """p: the teacher's P(churn) per row (soft labels), not class labels."""
+        self.regressor_ = clone(self.regressor).fit(X, p)
+        self.classes_ = np.asarray(self.classes)
+        return self
+
+    def predict_proba(self, X):
+        p1 = np.clip(self.regressor_.predict(X), 0.0, 1.0)
+        return np.column_stack([1.0 - p1, p1])
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+
+def student_path(model_path):
+    """models/best_model.pkl -> models/best_model_student.pkl"""
+    return os.path.splitext(model_path)[0] + "_student.pkl"
+
+
+def discard_student(model_path):
+    """Drop the student distilled from the model previously at model_path, once a new model replaced it,
+    so it is never published next to a teacher it was not distilled from."""
+    path = student_path(model_path)
+    if os.path.exists(path):
+        os.remove(path)
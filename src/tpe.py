@@ -0,0 +1,69 @@
+"""
+tpe.py
+Tree-structured Parzen Estimator over a discrete search space (lists of values per parameter).
+
+Finished trials are split into the best `gamma` fraction ("good") and the rest ("bad").
+For every parameter a smoothed categorical density is fitted to each side, l(x) and g(x);
+candidates are drawn from l and the one maximising l(x) / g(x) is proposed next.
+"""
+
+import numpy as np
+
+
+class TPESampler:
+    def __init__(self, param_dist, n_startup=5, gamma=0.25, n_ei_candidates=24, prior_weight=1.0, random_state=None):
+        self.names = list(param_dist)
+        self.values = [list(param_dist[n]) for n in self.names]
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_ei_candidates = n_ei_candidates
+        self.prior_weight = prior_weight
+        self.rng = np.random.RandomState(random_state)
+
+    def _encode(self, params):
+        return tuple(vals.index(params[n]) for n, vals in zip(self.names, self.values))
+
+    def _decode(self, idx):
+        return {n: vals[i] for n, vals, i in zip(self.names, self.values, idx)}
+
+    def _density(self, rows, j):
+        """Categorical density of parameter j over the given encoded trials, with a uniform prior."""
+        k = len(self.values[j])
+        w = np.full(k, self.prior_weight / k)
+        for r in rows:
+            w[r[j]] += 1.0
+        return w / w.sum()
+
+    def _random(self, seen):
+        for _ in range(1000):
+            idx = tuple(int(self.rng.randint(len(v))) for v in self.values)
+            if idx not in seen:
+                return idx
+        return None
+
+    def suggest(self, history):
+        """Next params given history = [(params, score), ...]; None once the space is exhausted."""
+        encoded = [(self._encode(p), s) for p, s in history]
+        seen = {e for e, _ in encoded}
+        if len(encoded) < self.n_startup:
+            idx = self._random(seen)
+            return None if idx is None else self._decode(idx)
+
+        ranked = sorted(encoded, key=lambda t: t[1], reverse=True)
+        n_good = max(1, int(np.ceil(self.gamma * len(ranked))))
+        good = [e for e, _ in ranked[:n_good]]
+        bad = [e for e, _ in ranked[n_good:]]
+        l = [self._density(good, j) for j in range(len(self.names))]
+        g = [self._density(bad, j) for j in range(len(self.names))]
+
+        best, best_ratio = None, -np.inf
+        for _ in range(self.n_ei_candidates):
+            idx = tuple(int(self.rng.choice(len(p), p=p)) for p in l)
+            if idx in seen:
+                continue
+            ratio = sum(np.log(l[j][i]) - np.log(g[j][i]) for j, i in enumerate(idx))
+            if ratio > best_ratio:
+                best, best_ratio = idx, ratio
+        if best is None:
+            best = self._random(seen)
+        return None if best is None else self._decode(best)
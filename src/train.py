@@ -3,62 +3,454 @@
 train.py
 Train a churn model from a cleaned CSV and save artifacts:
 - models/best_model.pkl
-- outputs/model_metrics.csv
+- models/best_model_serving.joblib (array-backed forest, memory-mappable; see serving.py, --engine rf)
+- models/best_model_preproc.npz (fused NumPy preprocessing, see preprocess.FusedPreprocessor)
+- models/registry/vNNNN/ (versioned bundle of the above, see registry.py)
+- outputs/model_metrics.parquet (.csv too with --csv)
+- outputs/model_metrics.json (with per-round savings for --search halving)
+- outputs/pareto_front.json (AUC / serving latency / model size trade-off of the finalists, cached-fold and OOB searches)
 - outputs/roc_curve.png
 - outputs/confusion_matrix.png
-- outputs/X_train_transformed.csv / X_test_transformed.csv
+- outputs/X_train_transformed.parquet / X_test_transformed.parquet (.npz when the one-hot matrix is sparse)
+- outputs/ordinal_mapping.parquet (code -> category, --encoding ordinal)
+- outputs/train_outputs.json (the files above this run wrote)
+
+All of outputs/ is stored with the registry version, and a training cache hit restores it.
+
+--incremental grows extra trees on a new labelled batch on top of a registered
+forest and writes the model, metrics and a new registry version (no plots).
+
+--chunksize N trains out of core on files larger than memory: the CSV (or its fresh
+Parquet cache, see columnar.py) is streamed twice in chunks of N rows (see chunked.py), no hyperparameter search is run
+(--params, else the latest registered best_params) and the same artifacts are
+written apart from plots and transformed matrices.
+
+Tables are written as Parquet; --csv also exports each one as CSV.
 """
 
 import argparse
+import math
 import os
 import json
+import resource
+import shutil
+import time
+import tracemalloc
+from functools import partial
 import numpy as np
 import pandas as pd
 import joblib
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from packaging import version
-from sklearn import __version__ as sklearn_version
-
-from sklearn.model_selection import train_test_split, StratifiedKFold, RandomizedSearchCV
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingRandomSearchCV)
+from sklearn.model_selection import (
+    train_test_split, StratifiedKFold, RandomizedSearchCV, HalvingRandomSearchCV, ParameterSampler
+)
+from sklearn.base import clone
 from imblearn.pipeline import Pipeline as ImbPipeline
-from imblearn.over_sampling import SMOTE
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import (
-    roc_auc_score, average_precision_score,
-    classification_report, confusion_matrix, roc_curve
+from imblearn.over_sampling import SMOTE, SMOTENC
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+
+from chunked import StratifiedReservoir, StreamingStats, merge_forests
+from columnar import write_table
+from evaluation import Evaluation
+from scipy import sparse
+from preprocess import (
+    build_preprocessor, categorical_mask, categorical_indices, use_sparse, save_matrix, as_float32, read_churn_csv, SPARSE_MIN_LEVELS, FusedPreprocessor, fused_path
 )
+from scheduler import parse_bytes, format_bytes, estimate_fit_bytes, worst_case_params, plan_parallelism
+from search import FoldCache, evaluate_candidates, evaluate_candidates_oob, race_candidates, bayes_search, select_candidate, pareto_front
+from trials import TrialStore
+from serving import export_serving, load_serving, serving_pipeline
+from student import discard_student
+from registry import ModelRegistry
+from utils import fingerprint_frame, fingerprint_config, library_versions
 
 import warnings
 warnings.filterwarnings("ignore")
 
-def precision_at_k(y_true, y_scores, k=0.05):
-    y_true = np.array(y_true)
-    kN = max(int(len(y_scores)*k), 1)
-    order = np.argsort(y_scores)[::-1][:kN]
-    return float(np.mean(y_true[order]))  # fraction of positives among top k
-
-def main(args):
-    os.makedirs(args.outdir, exist_ok=True)
-    os.makedirs(args.modeldir, exist_ok=True)
-
-    # 1) Load
-    df = pd.read_csv(args.data)
+def halving_round_savings(cv_results, n_splits, max_resources):
+    """Per-round cost of a successive-halving search vs. fitting every candidate at full resource.
+
+    Fit/score time is assumed to scale linearly with the resource, so a round's
+    full-resource cost is its observed cost scaled by max_resources / n_resources.
+    """
+    res = pd.DataFrame(cv_results)
+    rounds = []
+    for it, grp in res.groupby("iter"):
+        n_resources = int(grp["n_resources"].iloc[0])
+        spent = float((grp["mean_fit_time"] + grp["mean_score_time"]).sum() * n_splits)
+        full = spent * max_resources / n_resources
+        rounds.append({
+            "iter": int(it),
+            "n_candidates": int(len(grp)),
+            "n_resources": n_resources,
+            "fit_seconds": round(spent, 3),
+            "full_resource_seconds_est": round(full, 3),
+            "seconds_saved_est": round(full - spent, 3),
+        })
+    return rounds
+
+# arguments that change where or how fast a run goes, not the model it produces
+OUTPUTS_RECORD = "train_outputs.json"  # names of the files the last run wrote to --outdir
+RUN_ONLY_ARGS = ("data", "outdir", "modeldir", "registry", "n_jobs", "mem_budget", "trial_store", "force")
+
+
+def clean_labelled(df):
+    """Cleaned CSV rows -> (X, y) with the ID / leftover columns dropped."""
     # drop ID if present (won't error if not there)
     df = df.drop(columns=["CLIENTNUM"], errors="ignore")
     # drop any auto Naive Bayes cols if still present
     df = df.drop(columns=[c for c in df.columns if c.startswith("Naive_Bayes_Classifier")], errors="ignore")
-
-    # target
     if "Attrition_Flag" not in df.columns:
         raise ValueError("Expected 'Attrition_Flag' column in cleaned CSV.")
     X = df.drop("Attrition_Flag", axis=1)
-    y = df["Attrition_Flag"].map({"Existing Customer": 0, "Attrited Customer": 1})
+    y = df["Attrition_Flag"].astype(object).map({"Existing Customer": 0, "Attrited Customer": 1})
+    return X, y
+
+
+def load_labelled(path):
+    return clean_labelled(read_churn_csv(path))
+
+
+def make_sampler(encoding, numeric_feats, categorical_feats, random_state):
+    """SMOTE for one-hot columns; SMOTENC for ordinal codes (synthetic rows take their neighbours' category)."""
+    if encoding == "ordinal":
+        return SMOTENC(categorical_features=categorical_indices(numeric_feats, categorical_feats),
+                       random_state=random_state)
+    return SMOTE(random_state=random_state)
+
+
+def save_mapping(fused, args):
+    """outputs/ordinal_mapping.parquet: code -> category per column, for reading ordinal features.
+
+    Returns the files written (none for one-hot).
+    """
+    if fused.encoding != "ordinal":
+        return []
+    return write_table(fused.category_table(), os.path.join(args.outdir, "ordinal_mapping.csv"), csv=args.csv)
+
+
+def bundle_files(mapping, outputs, intermediates=()):
+    """Registry files of a run: metrics.json, the code table and every output file under outputs/,
+    so a training cache hit restores the outdir of that run (plots and tables included).
+
+    outputs[0] is model_metrics.json. intermediates (the transformed matrices) are recorded but not
+    bundled: a cache hit rebuilds them from the restored model. The list of names is also written to
+    <outdir>/train_outputs.json, which tells a later restore which files in the outdir this script wrote.
+    """
+    record = os.path.join(os.path.dirname(outputs[0]), OUTPUTS_RECORD)
+    outputs = outputs + [record]
+    with open(record, "w") as f:
+        json.dump([os.path.basename(path) for path in [*outputs, *intermediates]], f, indent=2)
+    files = {"metrics.json": outputs[0]}
+    if mapping:
+        files[os.path.basename(mapping[0])] = mapping[0]
+    files.update({f"outputs/{os.path.basename(path)}": path for path in outputs})
+    return files
+
+
+def save_transformed(preproc, X_train, X_test, encoding, args):
+    """outputs/X_<train|test>_transformed: the split as the fitted preprocessing sees it.
+
+    Returns (files written, feature names).
+    """
+    X_train_trans = preproc.transform(X_train)
+    X_test_trans = preproc.transform(X_test)
+    if encoding == "ordinal":
+        # small integer codes and tree inputs: float32 is exact for the forest
+        X_train_trans, X_test_trans = as_float32(X_train_trans), as_float32(X_test_trans)
+
+    # try to get feature names; fallback to generic names
+    try:
+        feature_names = preproc.get_feature_names_out()
+    except Exception:
+        feature_names = [f"feat_{i}" for i in range(X_train_trans.shape[1])]
+
+    # sparse one-hot: CSR .npz, never densified; otherwise Parquet (+ CSV)
+    files = save_matrix(os.path.join(args.outdir, "X_train_transformed"), X_train_trans, feature_names, csv=args.csv)
+    files += save_matrix(os.path.join(args.outdir, "X_test_transformed"), X_test_trans, feature_names, csv=args.csv)
+    return files, feature_names
+
+
+def restore_cached(registry, train_fp, args):
+    """If a registered model has this training fingerprint, restore it as the current model."""
+    cached = None if args.force else registry.find("train_fingerprint", train_fp)
+    if cached is None:
+        return False
+    model_path = os.path.join(args.modeldir, "best_model.pkl")
+    registry.restore(cached, model_path)
+    outputs = os.path.join(registry.root, cached, "outputs")
+    if os.path.isdir(outputs):
+        bundled = set(os.listdir(outputs))
+        try:
+            with open(os.path.join(args.outdir, OUTPUTS_RECORD)) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = []
+        for name in previous:  # written by the last run here but not part of the restored one
+            if name not in bundled and os.path.exists(os.path.join(args.outdir, name)):
+                os.remove(os.path.join(args.outdir, name))
+        for name in bundled:
+            shutil.copy2(os.path.join(outputs, name), os.path.join(args.outdir, name))
+    else:  # bundles published before outputs were stored carry the metrics only
+        shutil.copy2(os.path.join(registry.root, cached, "metrics.json"), os.path.join(args.outdir, "model_metrics.json"))
+    registry.set_latest(cached)
+    print(f"Training cache hit: data and settings match model {cached} (fingerprint {train_fp[:12]}); "
+          f"restored {model_path}. Use --force to retrain.")
+    return True
+
+
+def incremental_main(args):
+    """--incremental: grow trees on a newly labelled batch on top of a registered forest.
+
+    Preprocessing stays as fitted on the history (the existing trees depend on its
+    encoding); only the new trees see the new batch, so the cost follows the batch size.
+    """
+    # 1) new batch; a stratified slice of it is the rolling holdout (the newest labelled customers)
+    X, y = load_labelled(args.data)
+    X_new, X_hold, y_new, y_hold = train_test_split(
+        X, y, test_size=args.test_size, stratify=y, random_state=args.random_state
+    )
+
+    # 2) base model from the registry
+    registry = ModelRegistry(args.registry)
+    base_version = registry.latest() if args.base_version == "latest" else args.base_version
+    base_path = os.path.join(args.registry, base_version, "model.pkl")
+    with open(os.path.join(args.registry, base_version, "manifest.json")) as f:
+        base_manifest = json.load(f)
+    config = {k: v for k, v in vars(args).items() if k not in RUN_ONLY_ARGS + ("base_version",)}
+    train_fp = fingerprint_config(fingerprint_frame(X, y), {
+        "args": config, "base": base_manifest.get("train_fingerprint", base_version), "versions": library_versions()
+    })
+    if restore_cached(registry, train_fp, args):
+        return
+
+    base = joblib.load(base_path)
+    updated = joblib.load(base_path)  # independent copy to grow
+    forest = updated.named_steps["clf"]
+    if not isinstance(forest, RandomForestClassifier):
+        raise SystemExit(f"--incremental needs a RandomForest base model, {base_version} is {type(forest).__name__}")
+
+    # 3) grow new trees on the (SMOTE-balanced) batch; existing trees are kept as they are
+    Xt = updated.named_steps["preproc"].transform(X_new)
+    yt = y_new.values
+    if "smote" in updated.named_steps:
+        Xt, yt = updated.named_steps["smote"].fit_resample(Xt, yt)
+    n_before = len(forest.estimators_)
+    forest.set_params(warm_start=True, n_estimators=n_before + args.add_trees, n_jobs=args.n_jobs)
+    t0 = time.perf_counter()
+    forest.fit(Xt, yt)
+    fit_seconds = time.perf_counter() - t0
+    forest.set_params(warm_start=False)
+
+    # 4) retire the oldest trees beyond the budget
+    retired = 0
+    if args.max_trees and len(forest.estimators_) > args.max_trees:
+        retired = len(forest.estimators_) - args.max_trees
+        forest.estimators_ = forest.estimators_[retired:]
+        forest.set_params(n_estimators=len(forest.estimators_))
+    print(f"Grew {args.add_trees} trees on {len(X_new)} new rows in {fit_seconds:.1f}s; "
+          f"retired {retired}; forest now has {len(forest.estimators_)} trees")
+
+    # 5) rolling holdout: base vs updated model on the newest customers
+    base_ev = Evaluation(y_hold, base.predict_proba(X_hold)[:, 1])
+    ev = Evaluation(y_hold, updated.predict_proba(X_hold)[:, 1])
+    metrics = {
+        **ev.summary(),
+        # strict: the labels predict() would give
+        "classification_report": ev.report(0.5, strict=True),
+        "best_params": base_manifest.get("best_params"),
+        "search": "incremental",
+        "engine": "rf",
+        "incremental": {
+            "base_version": base_version,
+            "rows_new": int(len(X_new)),
+            "rows_holdout": int(len(X_hold)),
+            "trees_before": n_before,
+            "trees_added": args.add_trees,
+            "trees_retired": retired,
+            "trees_after": len(forest.estimators_),
+            "fit_seconds": fit_seconds,
+            "holdout_roc_auc_base": base_ev.roc_auc,
+            "holdout_pr_auc_base": base_ev.pr_auc,
+        },
+    }
+    print(f"Holdout ROC AUC: base {base_version} {metrics['incremental']['holdout_roc_auc_base']:.4f} "
+          f"-> updated {metrics['roc_auc']:.4f}")
+
+    # 6) save + register like a full run
+    model_path = os.path.join(args.modeldir, "best_model.pkl")
+    joblib.dump(updated, model_path)
+    discard_student(model_path)
+    fused = FusedPreprocessor.from_column_transformer(updated.named_steps["preproc"])
+    fused.save(fused_path(model_path))
+    export_serving(updated, model_path)
+    mapping = save_mapping(fused, args)
+    outputs = [os.path.join(args.outdir, "model_metrics.json"), *mapping]
+    with open(outputs[0], "w") as f:
+        json.dump(metrics, f, indent=2)
+    outputs += write_table(pd.DataFrame(metrics["classification_report"]).transpose(),
+                           os.path.join(args.outdir, "model_metrics.csv"), csv=args.csv, index=True)
+    version = registry.publish(
+        model_path,
+        metrics={k: metrics[k] for k in ("roc_auc", "pr_auc", "precision_at_5pct", "precision_at_10pct")},
+        data_fingerprint=fingerprint_frame(X, y),
+        feature_names=updated.named_steps["preproc"].get_feature_names_out(),
+        extra={"engine": "rf", "search": "incremental", "best_params": metrics["best_params"],
+               "train_fingerprint": train_fp, "incremental_from": base_version},
+        files=bundle_files(mapping, outputs),
+    )
+    print("Saved model:", model_path)
+    print(f"Registered model version: {version} (from {base_version}) in {args.registry}")
+
+
+def chunked_main(args):
+    """--chunksize: out-of-core training in two streaming passes over --data.
+
+    Pass 1 fits the preprocessing from streaming statistics; pass 2 transforms each
+    chunk and routes it to the test reservoir or to training:
+    - reservoir: a class-stratified sample of --sample_size rows, one SMOTE + forest fit
+    - forests:   SMOTE + a small forest per chunk, all trees merged into one forest
+    """
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    rng = np.random.RandomState(args.random_state)
+    registry = ModelRegistry(args.registry)
+
+    # 1) pass 1: preprocessing statistics
+    stats = StreamingStats(median_sample=args.median_sample, random_state=args.random_state)
+    for chunk in read_churn_csv(args.data, chunksize=args.chunksize):
+        X, y = clean_labelled(chunk)
+        stats.update(X, y.values)
+    fused = stats.to_preprocessor(args.encoding)
+    print(f"Pass 1: {stats.n_rows} rows, {fused.n_features_out} features, classes {dict(stats.class_counts)}")
+
+    # 2) forest settings: --params, else the latest registered search result, else defaults
+    if args.params:
+        params = json.loads(args.params)
+    else:
+        params = {}
+        try:
+            with open(os.path.join(args.registry, registry.latest(), "manifest.json")) as f:
+                params = json.load(f).get("best_params") or {}
+        except (FileNotFoundError, ValueError):
+            pass
+    params = {k.replace("clf__", ""): v for k, v in params.items() if k.startswith("clf__") or "__" not in k}
+    n_estimators = params.pop("n_estimators", 100)
+    smote = make_sampler(args.encoding, fused.numeric_feats, fused.categorical_feats, args.random_state)
+
+    def make_forest(n_trees, seed):
+        return RandomForestClassifier(n_estimators=n_trees, class_weight="balanced", random_state=seed,
+                                      n_jobs=args.n_jobs, **params)
+
+    # 3) pass 2: transform chunks, hold out test rows, train
+    test = StratifiedReservoir(args.eval_size, stats.class_counts, rng)
+    n_chunks = math.ceil(stats.n_rows / args.chunksize)
+    if args.chunk_mode == "reservoir":
+        train = StratifiedReservoir(args.sample_size, stats.class_counts, rng)
+    else:
+        trees_per_chunk = max(1, math.ceil(n_estimators / n_chunks))
+        forests = []
+    fit_seconds = 0.0
+    n_train = 0
+    for i, chunk in enumerate(read_churn_csv(args.data, chunksize=args.chunksize)):
+        X, y = clean_labelled(chunk)
+        Xt = fused.transform(X).astype(np.float32)
+        yt = y.values
+        held = rng.random_sample(len(yt)) < args.test_size
+        test.add(Xt[held], yt[held])
+        Xt, yt = Xt[~held], yt[~held]
+        n_train += len(yt)
+        if args.chunk_mode == "reservoir":
+            train.add(Xt, yt)
+            continue
+        if len(np.unique(yt)) < 2:
+            print(f"Chunk {i}: single class, skipped")
+            continue
+        t0 = time.perf_counter()
+        Xs, ys = smote.fit_resample(Xt, yt)
+        forests.append(make_forest(trees_per_chunk, args.random_state + i).fit(Xs, ys))
+        fit_seconds += time.perf_counter() - t0
+    if args.chunk_mode == "reservoir":
+        Xs, ys = train.sample()
+        print(f"Training sample: {len(ys)} of {n_train} rows ({train.nbytes / 1e6:.1f}MB)")
+        t0 = time.perf_counter()
+        Xs, ys = smote.fit_resample(Xs, ys)
+        forest = make_forest(n_estimators, args.random_state).fit(Xs, ys)
+        fit_seconds = time.perf_counter() - t0
+    else:
+        forest = merge_forests(forests)
+        print(f"Merged {len(forests)} per-chunk forests: {len(forest.estimators_)} trees")
+    best = ImbPipeline(steps=[("preproc", fused), ("smote", smote), ("clf", forest)])
+
+    # 4) evaluate on the held-out reservoir (already transformed)
+    X_test, y_test = test.sample()
+    ev = Evaluation(y_test, forest.predict_proba(X_test)[:, 1])
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    metrics = {
+        **ev.summary(),
+        "classification_report": ev.report(0.5),
+        "confusion_matrix": ev.confusion(0.5).tolist(),
+        "best_params": {f"clf__{k}": v for k, v in {**params, "n_estimators": n_estimators}.items()},
+        "search": "none",
+        "engine": "rf",
+        "chunked": {
+            "mode": args.chunk_mode,
+            "chunksize": args.chunksize,
+            "chunks": n_chunks,
+            "rows": stats.n_rows,
+            "rows_train": n_train,
+            "rows_fit": int(len(Xs)) if args.chunk_mode == "reservoir" else n_train,
+            "rows_test": int(len(y_test)),
+            "trees": len(forest.estimators_),
+            "fit_seconds": fit_seconds,
+            "total_seconds": time.perf_counter() - t_start,
+            "peak_traced_bytes": traced_peak,
+            "peak_rss_bytes": peak_rss,
+        },
+    }
+    print(f"Test ROC AUC: {metrics['roc_auc']:.4f} on {len(y_test)} held-out rows")
+    print(f"Peak memory: traced {format_bytes(traced_peak)}, RSS {format_bytes(peak_rss)}")
+
+    # 5) save + register like a full run
+    model_path = os.path.join(args.modeldir, "best_model.pkl")
+    joblib.dump(best, model_path)
+    discard_student(model_path)
+    fused.save(fused_path(model_path))
+    export_serving(best, model_path)
+    mapping = save_mapping(fused, args)
+    outputs = [os.path.join(args.outdir, "model_metrics.json"), *mapping]
+    with open(outputs[0], "w") as f:
+        json.dump(metrics, f, indent=2)
+    outputs += write_table(pd.DataFrame(metrics["classification_report"]).transpose(),
+                           os.path.join(args.outdir, "model_metrics.csv"), csv=args.csv, index=True)
+    version = registry.publish(
+        model_path,
+        metrics={k: metrics[k] for k in ("roc_auc", "pr_auc", "precision_at_5pct", "precision_at_10pct")},
+        feature_names=fused.feature_names,
+        extra={"engine": "rf", "search": "none", "best_params": metrics["best_params"], "chunked": args.chunk_mode},
+        files=bundle_files(mapping, outputs),
+    )
+    print("Saved model:", model_path)
+    print(f"Registered model version: {version} in {args.registry}")
+
+
+def main(args):
+    os.makedirs(args.outdir, exist_ok=True)
+    os.makedirs(args.modeldir, exist_ok=True)
+
+    if args.incremental:
+        return incremental_main(args)
+    if args.chunksize:
+        return chunked_main(args)
+
+    # 1) Load (features + target)
+    X, y = load_labelled(args.data)
 
     # 2) train/test split (stratified)
     X_train, X_test, y_train, y_test = train_test_split(
@@ -66,110 +458,280 @@ def main(args):
     )
 
     # 3) features identification
-    numeric_feats = X.select_dtypes(include=["int64", "float64"]).columns.tolist()
+    numeric_feats = X.select_dtypes(include=[np.number]).columns.tolist()
     categorical_feats = X.select_dtypes(include=["object", "category"]).columns.tolist()
     # ensure target not listed
     for t in ["Attrition_Flag"]:
         if t in categorical_feats: categorical_feats.remove(t)
 
     # 4) build transformers
-    numeric_transformer = Pipeline([
-        ("imputer", SimpleImputer(strategy="median")),
-        ("scaler", StandardScaler())
-    ])
-
-    # choose OneHotEncoder param depending on sklearn version
-    if version.parse(sklearn_version) >= version.parse("1.2"):
-        onehot = OneHotEncoder(handle_unknown="ignore", sparse_output=False)
+    encoding = args.encoding
+    # CSR one-hot once the categoricals expand to many columns (--sparse auto)
+    sparse_onehot = encoding == "onehot" and use_sparse(X_train, categorical_feats, args.sparse, args.sparse_min_levels)
+    if sparse_onehot:
+        print("Sparse one-hot path (CSR through SMOTE and the forest)")
+    # the forest's SMOTE / SMOTENC measures distances, so its numerics are standardised either way
+    scale = args.engine == "rf"
+    preprocessor = build_preprocessor(numeric_feats, categorical_feats, encoding=encoding, sparse=sparse_onehot,
+                                      scale=scale)
+
+    # 5) modeling pipeline + 6) hyperparameter search space
+    if args.engine == "hgb":
+        # histogram gradient boosting: native categorical splits on the ordinal codes,
+        # class weighting instead of SMOTE
+        clf = HistGradientBoostingClassifier(
+            categorical_features=categorical_mask(numeric_feats, categorical_feats),
+            class_weight="balanced",
+            random_state=args.random_state
+        )
+        pipeline = ImbPipeline(steps=[
+            ("preproc", preprocessor),
+            ("clf", clf)
+        ])
+        grow_param = "clf__max_iter"
+        param_dist = {
+            "clf__max_iter": [100, 200, 300, 500],
+            "clf__learning_rate": [0.03, 0.05, 0.1, 0.2],
+            "clf__max_leaf_nodes": [15, 31, 63],
+            "clf__min_samples_leaf": [10, 20, 50],
+            "clf__l2_regularization": [0.0, 0.1, 1.0]
+        }
     else:
-        onehot = OneHotEncoder(handle_unknown="ignore", sparse=False)
-
-    categorical_transformer = Pipeline([
-        ("imputer", SimpleImputer(strategy="most_frequent")),
-        ("onehot", onehot)
-    ])
-
-    preprocessor = ColumnTransformer([
-        ("num", numeric_transformer, numeric_feats),
-        ("cat", categorical_transformer, categorical_feats)
-    ], remainder="drop")
-
-    # 5) modeling pipeline (imblearn pipeline to include SMOTE)
-    clf = RandomForestClassifier(class_weight="balanced", random_state=args.random_state)
-    pipeline = ImbPipeline(steps=[
-        ("preproc", preprocessor),
-        ("smote", SMOTE(random_state=args.random_state)),
-        ("clf", clf)
-    ])
-
-    # 6) hyperparameter search space (RandomForest)
-    param_dist = {
-        "clf__n_estimators": [100, 200, 300, 500],
-        "clf__max_depth": [None, 6, 12, 20],
-        "clf__min_samples_split": [2, 5, 10],
-        "clf__min_samples_leaf": [1, 2, 4],
-        "clf__max_features": ["sqrt", "log2", None]
-    }
+        # imblearn pipeline to include SMOTE (SMOTENC for ordinal codes)
+        clf = RandomForestClassifier(class_weight="balanced", random_state=args.random_state)
+        pipeline = ImbPipeline(steps=[
+            ("preproc", preprocessor),
+            ("smote", make_sampler(encoding, numeric_feats, categorical_feats, args.random_state)),
+            ("clf", clf)
+        ])
+        grow_param = "clf__n_estimators"
+        param_dist = {
+            "clf__n_estimators": [100, 200, 300, 500],
+            "clf__max_depth": [None, 6, 12, 20],
+            "clf__min_samples_split": [2, 5, 10],
+            "clf__min_samples_leaf": [1, 2, 4],
+            "clf__max_features": ["sqrt", "log2", None]
+        }
+
+    # training cache: same data, settings, search space and library versions -> same model
+    config = {k: v for k, v in vars(args).items() if k not in RUN_ONLY_ARGS}
+    config["fold_cache"] = bool(args.fold_cache)  # where the cache lives does not matter
+    train_fp = fingerprint_config(fingerprint_frame(X, y), {
+        "args": config, "param_dist": param_dist, "versions": library_versions()
+    })
+    registry = ModelRegistry(args.registry)
+    if restore_cached(registry, train_fp, args):
+        # the bundle leaves out the transformed matrices; rebuild them from the restored model
+        restored = joblib.load(os.path.join(args.modeldir, "best_model.pkl"))
+        save_transformed(restored.named_steps["preproc"], X_train, X_test, encoding, args)
+        return
 
     cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=args.random_state)
-    rs = RandomizedSearchCV(
-        estimator=pipeline,
-        param_distributions=param_dist,
-        n_iter=args.n_iter,
-        scoring="roc_auc",
-        cv=cv,
-        verbose=2,
-        n_jobs=args.n_jobs,
-        random_state=args.random_state,
-        refit=True
-    )
+    custom_search = args.search in ("racing", "bayes") or args.fold_cache or args.selection == "oob"
+
+    # cap concurrent fits to the memory budget and split cores between search and forest
+    n_jobs = args.n_jobs
+    schedule = None
+    if args.mem_budget:
+        k = cv.get_n_splits()
+        n_rows = len(X_train) if args.selection == "oob" else len(X_train) * (k - 1) // k
+        if "smote" in pipeline.named_steps:
+            n_rows = int(2 * np.bincount(y_train).max() * n_rows / len(X_train))
+        if encoding == "onehot":
+            n_features = len(numeric_feats) + int(sum(X_train[c].nunique() for c in categorical_feats))
+        else:
+            n_features = len(numeric_feats) + len(categorical_feats)
+        # per-fit memory grows with the forest's own threads (one tree-building buffer each)
+        fit_bytes = partial(estimate_fit_bytes, n_rows, n_features, worst_case_params(param_dist),
+                            engine=args.engine, shared_data=bool(custom_search))
+        n_jobs, clf_jobs = plan_parallelism(fit_bytes, parse_bytes(args.mem_budget), args.n_jobs)
+        per_fit = fit_bytes(n_threads=clf_jobs)
+        if args.engine == "rf":
+            clf.set_params(n_jobs=clf_jobs)
+        schedule = {"mem_budget": args.mem_budget, "est_bytes_per_fit": per_fit,
+                    "concurrent_fits": n_jobs, "threads_per_fit": clf_jobs}
+        print(f"Scheduler: ~{format_bytes(per_fit)} per fit -> {n_jobs} concurrent fits x {clf_jobs} threads")
+
+    rs = None
+    if args.search == "halving":
+        # successive halving: every candidate starts on a cheap budget and only the
+        # best 1/factor survive to the next round with factor x more resource
+        if args.halving_resource == "n_estimators":
+            resource = grow_param
+            max_resources = max(param_dist.pop(grow_param))
+        else:
+            resource = "n_samples"
+            max_resources = int(len(X_train) * (cv.get_n_splits() - 1) / cv.get_n_splits())
+        rs = HalvingRandomSearchCV(
+            estimator=pipeline,
+            param_distributions=param_dist,
+            n_candidates=args.n_iter,
+            factor=args.halving_factor,
+            resource=resource,
+            max_resources=max_resources,
+            min_resources="exhaust",
+            scoring="roc_auc",
+            cv=cv,
+            verbose=2,
+            n_jobs=n_jobs,
+            random_state=args.random_state,
+            refit=True
+        )
+    elif not custom_search:
+        rs = RandomizedSearchCV(
+            estimator=pipeline,
+            param_distributions=param_dist,
+            n_iter=args.n_iter,
+            scoring="roc_auc",
+            cv=cv,
+            verbose=2,
+            n_jobs=n_jobs,
+            random_state=args.random_state,
+            refit=True
+        )
 
     # 7) fit
-    print("Fitting RandomizedSearchCV...")
-    rs.fit(X_train, y_train)
-
-    print("Best params:", rs.best_params_)
-    best = rs.best_estimator_
+    search_results = None
+    if rs is not None:
+        print(f"Fitting {type(rs).__name__}...")
+        rs.fit(X_train, y_train)
+        best_params = rs.best_params_
+        best = rs.best_estimator_
+    else:
+        candidates = list(ParameterSampler(param_dist, n_iter=args.n_iter, random_state=args.random_state))
+        # every option that changes the transformed matrix, so fold caches and stored trials
+        # from a one-hot run are never reused for an ordinal one (and vice versa)
+        data_fp = (f"{fingerprint_frame(X_train, y_train)}:{args.engine}:{args.random_state}:"
+                   f"{encoding}:sparse={bool(sparse_onehot)}:scale={scale}")
+        store = TrialStore(args.trial_store) if args.trial_store else None
+        t0 = time.perf_counter()
+        if args.selection == "oob":
+            # one fit per candidate on the training split, scored on out-of-bag rows
+            print(f"Scoring {len(candidates)} candidates on out-of-bag predictions...")
+            search_results = evaluate_candidates_oob(
+                preprocessor, pipeline.named_steps.get("smote"), clf, X_train, y_train, candidates,
+                n_jobs=n_jobs, verbose=2,
+                warm_start=args.warm_start, grow_grid=param_dist[grow_param], grow_param=grow_param,
+                store=store, fingerprint=f"{data_fp}:oob"
+            )
+        else:
+            # preprocessing + SMOTE run once per fold; candidates only fit the forest
+            cache = FoldCache(args.fold_cache, preprocessor, pipeline.named_steps.get("smote"), cv)
+            cache.build(X_train, y_train, fingerprint=data_fp)
+
+            print(f"Scoring {len(candidates)} candidates on {cache.n_splits} cached folds...")
+            if args.search == "bayes":
+                search_results, bayes_stats = bayes_search(
+                    cache, clf, param_dist, args.n_iter, n_startup=args.n_startup, random_state=args.random_state,
+                    n_jobs=n_jobs, verbose=2,
+                    warm_start=args.warm_start, grow_grid=param_dist[grow_param], grow_param=grow_param,
+                    store=store, fingerprint=f"{data_fp}:cv{cache.n_splits}"
+                )
+            elif args.search == "racing":
+                search_results, race_stats = race_candidates(
+                    cache, clf, candidates, confidence=args.race_confidence, n_jobs=n_jobs, verbose=2,
+                    warm_start=args.warm_start, grow_grid=param_dist[grow_param], grow_param=grow_param,
+                    store=store, fingerprint=f"{data_fp}:cv{cache.n_splits}"
+                )
+                print(f"Racing skipped {race_stats['fits_skipped']} of "
+                      f"{race_stats['fits_skipped'] + race_stats['fits_run']} fold fits")
+            else:
+                search_results = evaluate_candidates(
+                    cache, clf, candidates, n_jobs=n_jobs, verbose=2,
+                    warm_start=args.warm_start, grow_grid=param_dist[grow_param], grow_param=grow_param,
+                    store=store, fingerprint=f"{data_fp}:cv{cache.n_splits}"
+                )
+        search_seconds = time.perf_counter() - t0
+        if store is not None:
+            store.close()
+        # serving cost of every finalist, timed on the artifact predict.py / scoring.py load
+        chosen, best = select_candidate(
+            search_results, lambda params: clone(pipeline).set_params(**params).fit(X_train, y_train),
+            X_train, args.max_latency_ms, args.max_model_mb,
+            serve=lambda model: serving_pipeline(model) or model, verbose=1
+        )
+        best_params = chosen["params"]
+
+    print("Best params:", best_params)
 
     # 8) evaluate on test
+    # one sort of the test scores gives every metric; labels are what predict() returns
+    # (probability > 0.5), without scoring the test set a second time
     probs = best.predict_proba(X_test)[:, 1]
-    y_pred = best.predict(X_test)
-
-    roc = roc_auc_score(y_test, probs)
-    pr_auc = average_precision_score(y_test, probs)
-    report = classification_report(y_test, y_pred, output_dict=True)
-    cm = confusion_matrix(y_test, y_pred)
-
-    # precision@k
-    p_at_5 = precision_at_k(y_test, probs, k=0.05)
-    p_at_10 = precision_at_k(y_test, probs, k=0.10)
+    ev = Evaluation(y_test, probs)
+    roc = ev.roc_auc
+    report = ev.report(0.5, strict=True)
+    cm = ev.confusion(0.5, strict=True)
 
     metrics = {
-        "roc_auc": roc,
-        "pr_auc": pr_auc,
-        "precision_at_5pct": p_at_5,
-        "precision_at_10pct": p_at_10,
+        **ev.summary(),
         "classification_report": report,
-        "best_params": rs.best_params_
+        "best_params": best_params,
+        "search": args.search,
+        "selection": args.selection,
+        "engine": args.engine
     }
+    if search_results is not None:
+        metrics["cv_results"] = search_results
+        metrics["search_seconds"] = search_seconds
+        metrics["warm_start"] = args.warm_start
+        metrics["selected_latency_ms"] = chosen["latency_ms"]
+        metrics["selected_model_mb"] = chosen["model_mb"]
+        metrics["budget"] = {"max_latency_ms": args.max_latency_ms, "max_model_mb": args.max_model_mb}
+    if args.search == "racing":
+        metrics["racing"] = race_stats
+    if args.search == "bayes":
+        metrics["bayes"] = bayes_stats
+    if schedule is not None:
+        metrics["scheduler"] = schedule
+    if args.selection == "oob":
+        metrics["oob_roc_auc"] = chosen["oob_roc_auc"]
+        print(f"OOB ROC AUC (train): {metrics['oob_roc_auc']:.4f}  |  test ROC AUC: {roc:.4f}")
+    if args.search == "halving":
+        metrics["search_rounds"] = halving_round_savings(rs.cv_results_, cv.get_n_splits(), max_resources)
+        metrics["halving_resource"] = args.halving_resource
+        print("Estimated seconds saved per round:", [r["seconds_saved_est"] for r in metrics["search_rounds"]])
 
     # 9) save artifacts
     model_path = os.path.join(args.modeldir, "best_model.pkl")
     joblib.dump(best, model_path)
+    discard_student(model_path)
+    fused = FusedPreprocessor.from_column_transformer(best.named_steps["preproc"])
+    fused.save(fused_path(model_path))
+    mapping = save_mapping(fused, args)
+    expected = best.named_steps["preproc"].transform(X_test)
+    if sparse.issparse(expected):
+        expected = expected.toarray()
+    metrics["fused_preproc_max_diff"] = float(np.max(np.abs(fused.transform(X_test) - expected)))
+    metrics["sparse_onehot"] = bool(sparse_onehot)
+    if export_serving(best, model_path) is not None:
+        # flattened forest for fast, process-shared scoring; parity checked on the test set
+        serving = load_serving(model_path)
+        compact_probs = serving.named_steps["clf"].predict_proba(fused.transform(X_test))[:, 1]
+        metrics["forest_export_max_diff"] = float(np.max(np.abs(compact_probs - probs)))
+        print(f"Exported array-backed forest ({serving.named_steps['clf'].n_nodes} nodes), "
+              f"max |diff| = {metrics['forest_export_max_diff']:.2e}")
 
     # save metrics json & csv
-    with open(os.path.join(args.outdir, "model_metrics.json"), "w") as f:
+    outputs = [os.path.join(args.outdir, "model_metrics.json"), *mapping]
+    with open(outputs[0], "w") as f:
         json.dump(metrics, f, indent=2)
+    if search_results is not None:
+        outputs.append(os.path.join(args.outdir, "pareto_front.json"))
+        with open(outputs[-1], "w") as f:
+            json.dump(pareto_front(search_results), f, indent=2)
 
-    pd.DataFrame(report).transpose().to_csv(os.path.join(args.outdir, "model_metrics.csv"))
+    outputs += write_table(pd.DataFrame(report).transpose(), os.path.join(args.outdir, "model_metrics.csv"),
+                           csv=args.csv, index=True)
 
     # save roc curve
-    fpr, tpr, _ = roc_curve(y_test, probs)
+    fpr, tpr, _ = ev.roc_curve()
     plt.figure()
     plt.plot(fpr, tpr, label=f"AUC={roc:.3f}")
     plt.plot([0,1],[0,1],"--", color="grey")
     plt.xlabel("FPR"); plt.ylabel("TPR"); plt.title("ROC Curve"); plt.legend(loc="lower right")
-    plt.savefig(os.path.join(args.outdir, "roc_curve.png"))
+    outputs.append(os.path.join(args.outdir, "roc_curve.png"))
+    plt.savefig(outputs[-1])
     plt.close()
 
     # save confusion matrix heatmap
@@ -177,24 +739,25 @@ def main(args):
     sns.heatmap(cm, annot=True, fmt="d", cmap="Blues",
                 xticklabels=["No Churn","Churn"], yticklabels=["No Churn","Churn"])
     plt.title("Confusion Matrix")
-    plt.savefig(os.path.join(args.outdir, "confusion_matrix.png"))
+    outputs.append(os.path.join(args.outdir, "confusion_matrix.png"))
+    plt.savefig(outputs[-1])
     plt.close()
 
     # save transformed train/test sets (column names best-effort)
-    preproc = best.named_steps["preproc"]
-    X_train_trans = preproc.transform(X_train)
-    X_test_trans = preproc.transform(X_test)
-
-    # try to get feature names; fallback to generic names
-    try:
-        feature_names = preproc.get_feature_names_out()
-    except Exception:
-        feature_names = [f"feat_{i}" for i in range(X_train_trans.shape[1])]
-
-    pd.DataFrame(X_train_trans, columns=feature_names).to_csv(os.path.join(args.outdir, "X_train_transformed.csv"), index=False)
-    pd.DataFrame(X_test_trans, columns=feature_names).to_csv(os.path.join(args.outdir, "X_test_transformed.csv"), index=False)
+    intermediates, feature_names = save_transformed(best.named_steps["preproc"], X_train, X_test, encoding, args)
+
+    # 10) publish a versioned bundle (previous versions stay loadable)
+    version = ModelRegistry(args.registry).publish(
+        model_path,
+        metrics={k: metrics[k] for k in ("roc_auc", "pr_auc", "precision_at_5pct", "precision_at_10pct")},
+        data_fingerprint=fingerprint_frame(X, y),
+        feature_names=feature_names,
+        extra={"engine": args.engine, "search": args.search, "best_params": best_params, "train_fingerprint": train_fp},
+        files=bundle_files(mapping, outputs, intermediates),
+    )
 
     print("Saved model:", model_path)
+    print(f"Registered model version: {version} in {args.registry}")
     print("Saved metrics + plots in:", args.outdir)
     print("Done.")
 
@@ -203,9 +766,93 @@ if __name__ == "__main__":
     parser.add_argument("--data", type=str, default="D:\\AI Hackathon\\data\\bank_churn_cleaned.csv", help="Path to cleaned CSV")
     parser.add_argument("--outdir", type=str, default="outputs", help="Folder to save metrics/plots/transformed")
     parser.add_argument("--modeldir", type=str, default="models", help="Folder to save model pickle")
+    parser.add_argument("--registry", type=str, default=None, help="Model registry folder (default: <modeldir>/registry)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Grow --add_trees trees on the new labelled batch in --data on top of a registered "
+                             "forest instead of retraining on the full history (--test_size is the rolling holdout)")
+    parser.add_argument("--base_version", type=str, default="latest", help="Registry version to extend (--incremental)")
+    parser.add_argument("--add_trees", type=int, default=100, help="Trees grown on the new batch (--incremental)")
+    parser.add_argument("--max_trees", type=int, default=None,
+                        help="Tree budget; the oldest trees are retired beyond it (--incremental)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Train out of core, streaming --data in chunks of this many rows (no search)")
+    parser.add_argument("--chunk_mode", choices=["reservoir", "forests"], default="reservoir",
+                        help="reservoir: fit one forest on a stratified sample of --sample_size rows; "
+                             "forests: fit a small forest per chunk and merge the trees; needs well-shuffled "
+                             "files, each chunk's trees only see that chunk (--chunksize)")
+    parser.add_argument("--sample_size", type=int, default=200_000, help="Training reservoir rows (--chunk_mode reservoir)")
+    parser.add_argument("--eval_size", type=int, default=50_000, help="Held-out reservoir rows (--chunksize)")
+    parser.add_argument("--median_sample", type=int, default=100_000,
+                        help="Values sampled per numeric column for the imputation medians (--chunksize)")
+    parser.add_argument("--params", type=str, default=None,
+                        help='Forest settings as JSON, e.g. \'{"n_estimators": 300, "max_depth": 20}\' (--chunksize)')
+    parser.add_argument("--force", action="store_true",
+                        help="Retrain even if a registered model was trained on the same data and settings")
     parser.add_argument("--test_size", type=float, default=0.20)
     parser.add_argument("--n_iter", type=int, default=20, help="Number of RandomizedSearch iterations")
     parser.add_argument("--n_jobs", type=int, default=-1)
+    parser.add_argument("--engine", choices=["rf", "hgb"], default="rf",
+                        help="rf: one-hot + SMOTE + RandomForest; hgb: ordinal codes + class-weighted HistGradientBoosting")
+    parser.add_argument("--search", choices=["random", "halving", "racing", "bayes"], default="random",
+                        help="random: RandomizedSearchCV; halving: successive halving (HalvingRandomSearchCV); "
+                             "racing: fold-by-fold, dropping candidates that are clearly behind; "
+                             "bayes: TPE proposals from finished trials (racing/bayes use the fold cache)")
+    parser.add_argument("--n_startup", type=int, default=5, help="Random candidates before TPE proposals (--search bayes)")
+    parser.add_argument("--halving_resource", choices=["n_estimators", "n_samples"], default="n_estimators",
+                        help="Resource grown between halving rounds (n_estimators means max_iter for --engine hgb)")
+    parser.add_argument("--halving_factor", type=int, default=3, help="Candidates kept per round = 1/factor")
+    parser.add_argument("--fold_cache", type=str, default=None,
+                        help="Folder for per-fold preprocessed/SMOTE arrays shared by all candidates (random search only)")
+    parser.add_argument("--encoding", choices=["onehot", "ordinal"], default=None,
+                        help="Categoricals as one-hot columns or as integer codes in one column each (float32 "
+                             "matrix, SMOTENC for rf, code table in outputs/ordinal_mapping.parquet). "
+                             "Default: onehot for rf, ordinal for hgb")
+    parser.add_argument("--csv", action="store_true",
+                        help="Also export the metrics, code table and transformed matrices as CSV")
+    parser.add_argument("--sparse", choices=["auto", "on", "off"], default="auto",
+                        help="CSR one-hot matrices through SMOTE and the forest (--engine rf); auto: when the "
+                             "categoricals expand to at least --sparse_min_levels columns. CSR cuts memory, "
+                             "but the forest fits more slowly on it")
+    parser.add_argument("--sparse_min_levels", type=int, default=SPARSE_MIN_LEVELS, help="One-hot columns from which --sparse auto uses CSR")
     parser.add_argument("--random_state", type=int, default=42)
+    parser.add_argument("--warm_start", action="store_true",
+                        help="Grow one forest per group of candidates that differ only in n_estimators (uses the fold cache)")
+    parser.add_argument("--race_confidence", type=float, default=0.95,
+                        help="Confidence level of the ROC AUC bounds used to drop candidates (--search racing)")
+    parser.add_argument("--selection", choices=["cv", "oob"], default="cv",
+                        help="cv: 5-fold StratifiedKFold; oob: out-of-bag ROC AUC from one fit per candidate (--engine rf)")
+    parser.add_argument("--trial_store", type=str, default=None,
+                        help="SQLite file recording every finished (data, params, fold) trial; reruns resume from it "
+                             "and reuse matching trials (uses the fold cache)")
+    parser.add_argument("--mem_budget", type=str, default=None,
+                        help="Memory budget for concurrent search fits, e.g. 8GB; caps parallel fits and gives "
+                             "spare cores to the forest (n_jobs)")
+    parser.add_argument("--max_latency_ms", type=float, default=None,
+                        help="Only select candidates whose serving artifact scores 1000 rows within this many ms, "
+                             "measured on the final fit of every finalist")
+    parser.add_argument("--max_model_mb", type=float, default=None,
+                        help="Only select candidates whose pickled serving artifact is at most this size in MB, "
+                             "measured like --max_latency_ms")
     args = parser.parse_args()
+    if args.registry is None:
+        args.registry = os.path.join(args.modeldir, "registry")
+    if args.encoding is None:
+        args.encoding = "ordinal" if args.engine == "hgb" else "onehot"
+    if args.engine == "hgb" and args.encoding != "ordinal":
+        parser.error("--engine hgb splits on ordinal codes natively (--encoding ordinal)")
+    budgeted = args.max_latency_ms is not None or args.max_model_mb is not None
+    if (args.warm_start or args.search in ("racing", "bayes") or args.trial_store) and not args.fold_cache and args.selection == "cv":
+        args.fold_cache = os.path.join(args.outdir, "fold_cache")
+    if args.search == "halving" and (args.fold_cache or args.warm_start or args.trial_store or budgeted
+                                     or args.selection == "oob"):
+        parser.error("--fold_cache / --warm_start / --trial_store / --max_latency_ms / --max_model_mb / "
+                     "--selection oob are not supported with --search halving")
+    if args.search in ("racing", "bayes") and args.selection == "oob":
+        parser.error(f"--search {args.search} runs on the CV fold cache; it cannot be combined with --selection oob")
+    if args.chunksize and (args.engine != "rf" or args.incremental):
+        parser.error("--chunksize trains a RandomForest from scratch (--engine rf, not --incremental)")
+    if args.incremental and args.engine != "rf":
+        parser.error("--incremental grows RandomForest trees (--engine rf)")
+    if args.selection == "oob" and args.engine != "rf":
+        parser.error("--selection oob needs a bagged forest (--engine rf)")
     main(args)
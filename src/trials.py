@@ -0,0 +1,67 @@
+"""
+trials.py
+Persistent store of finished search trials (one row per data fingerprint, params, fold).
+
+A trial is written as soon as it finishes, so a killed search resumes where it
+stopped, and later runs on the same data reuse every (params, fold) score they share.
+"""
+
+import json
+import sqlite3
+import time
+
+
+def params_key(params) -> str:
+    """Canonical JSON for a params dict (sorted keys, numpy scalars as plain values)."""
+    return json.dumps(params, sort_keys=True, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+
+
+class TrialStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS trials (
+                fingerprint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                fold INTEGER NOT NULL,
+                score REAL NOT NULL,
+                info TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (fingerprint, params, fold)
+            )"""
+        )
+        # stores created before the info column existed
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(trials)")]
+        if "info" not in columns:
+            self.conn.execute("ALTER TABLE trials ADD COLUMN info TEXT")
+        self.conn.commit()
+
+    def get(self, fingerprint, params, fold):
+        """The stored trial dict ({'score': ...}) or None.
+
+        Rows written before the info column existed have NULL info; their score is all a trial needs.
+        """
+        row = self.conn.execute(
+            "SELECT score, info FROM trials WHERE fingerprint = ? AND params = ? AND fold = ?",
+            (fingerprint, params_key(params), int(fold))
+        ).fetchone()
+        if row is None:
+            return None
+        return {"score": row[0], **json.loads(row[1] or "{}")}
+
+    def put(self, fingerprint, params, fold, trial):
+        info = {k: v for k, v in trial.items() if k != "score"}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO trials (fingerprint, params, fold, score, info, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (fingerprint, params_key(params), int(fold), float(trial["score"]), json.dumps(info), time.time())
+        )
+        self.conn.commit()
+
+    def count(self, fingerprint=None):
+        if fingerprint is None:
+            return self.conn.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM trials WHERE fingerprint = ?", (fingerprint,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,36 @@
+"""
+utils.py
+Small helpers shared by the training / prediction scripts.
+"""
+
+import hashlib
+import json
+import platform
+
+import pandas as pd
+
+
+def fingerprint_frame(X: pd.DataFrame, y=None) -> str:
+    """Stable sha256 over the values, column names and dtypes of X (and y if given)."""
+    h = hashlib.sha256()
+    h.update(json.dumps([[str(c), str(t)] for c, t in X.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(X, index=True).values.tobytes())
+    if y is not None:
+        h.update(pd.util.hash_pandas_object(pd.Series(y), index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def library_versions() -> dict:
+    """Versions of the libraries a trained model depends on."""
+    import imblearn
+    import numpy
+    import sklearn
+    return {"python": platform.python_version(), "numpy": numpy.__version__, "pandas": pd.__version__,
+            "sklearn": sklearn.__version__, "imblearn": imblearn.__version__}
+
+
+def fingerprint_config(data_fingerprint: str, config: dict) -> str:
+    """sha256 over a data fingerprint and a JSON-able config (sorted keys)."""
+    h = hashlib.sha256(data_fingerprint.encode())
+    h.update(json.dumps(config, sort_keys=True, default=str).encode())
+    return h.hexdigest()
@@ -2,8 +2,19 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 from typing import List, Dict, Any, Optional
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+try:
+    from columnar import read_table
+    from preprocess import read_churn_csv
+except ImportError:
+    read_churn_csv = pd.read_csv
+
+    def read_table(path):
+        return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
 class CustomerDataService:
     def __init__(self):
         self.customers_df = None
@@ -29,7 +40,7 @@ class CustomerDataService:
             # Load customer data
             for path in data_paths:
                 try:
-                    self.customers_df = pd.read_csv(path)
+                    self.customers_df = read_churn_csv(path)
                     break
                 except FileNotFoundError:
                     continue
@@ -37,7 +48,7 @@ class CustomerDataService:
             # Load predictions data
             for path in prediction_paths:
                 try:
-                    self.predictions_df = pd.read_csv(path)
+                    self.predictions_df = read_table(path)
                     break
                 except FileNotFoundError:
                     continue
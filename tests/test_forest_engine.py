@@ -0,0 +1,40 @@
+"""
+test_forest_engine.py
+Parity of the array-backed forest with the sklearn RandomForest it was exported from.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import forest_engine  # noqa: E402
+from forest_engine import CompactForest  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    X, y = make_classification(n_samples=600, n_features=12, n_informative=6, weights=[0.84], random_state=0)
+    X = X.astype(np.float32)
+    rf = RandomForestClassifier(n_estimators=25, min_samples_leaf=2, random_state=0).fit(X[:400], y[:400])
+    return rf, X[400:]
+
+
+@pytest.mark.parametrize("compiled", [True, False], ids=["compiled", "numpy"])
+def test_predict_proba_matches_sklearn(fitted, monkeypatch, compiled):
+    rf, X = fitted
+    if not compiled:
+        monkeypatch.setattr(forest_engine, "_traverse_compiled", None)
+    elif forest_engine._traverse_compiled is None:
+        pytest.skip("numba is not installed")
+    compact = CompactForest.from_sklearn(rf)
+    # same leaves per tree; only the order the tree probabilities are summed in differs (last-bit noise)
+    np.testing.assert_allclose(compact.predict_proba(X, batch_size=64), rf.predict_proba(X), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(compact.predict(X), rf.predict(X))